@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+import inspect
+import types
+
+class Agent(object):
+    """
+    Base class for bidding agents.  Agents use __slots__, so a sweep with
+    thousands of agents doesn't carry a __dict__ per agent; subclasses list
+    any attributes they add in their own __slots__.
+
+    reset() gets an agent ready for a new simulation with another value and
+    budget, so the same object can be reused across permutations.
+    Subclasses with per-simulation state clear it there as well.
+    """
+    __slots__ = ('id', 'value', 'budget')
+
+    def __init__(self, id, value, budget):
+        self.id = id
+        self.reset(value, budget)
+
+    def reset(self, value, budget):
+        self.value = value
+        self.budget = budget
+
+    def __repr__(self):
+        return "%s(id=%d, value=%d)" % (
+            self.__class__.__name__, self.id, self.value)
+
+
+def reusable(agent_class):
+    """
+    Whether agents of agent_class can be reset() for another simulation
+    instead of being constructed again: it must have a reset() defined no
+    higher up in the class hierarchy than its __init__, so that reset()
+    sets up everything __init__ does.
+    """
+    if not isinstance(agent_class, (type, types.ClassType)):
+        return False
+
+    def defined_in(name):
+        for c in inspect.getmro(agent_class):
+            if name in c.__dict__:
+                return c
+        return None
+
+    init = defined_in('__init__')
+    reset = defined_in('reset')
+    return reset is not None and (init is None or issubclass(reset, init))
+
+
+class AgentPool:
+    """
+    The agents of a sweep, kept alive from one simulation to the next.
+    Agents of reusable() classes are reset() with their new value and
+    budget; others are constructed again every time.
+    """
+    def __init__(self, class_names, agent_classes):
+        self.class_names = list(class_names)
+        self.classes = [agent_classes[name] for name in class_names]
+        self.reuse = [reusable(c) for c in self.classes]
+        self.pool = [None] * len(self.classes)
+
+    def matches(self, class_names, agent_classes):
+        """Whether the pool has the agents of these classes."""
+        return (self.class_names == list(class_names) and
+                all(c is agent_classes[name]
+                    for (c, name) in zip(self.classes, class_names)))
+
+    def agents(self, values, budget):
+        """Agents 0, 1, ... with the given values and budget."""
+        agents = []
+        for (a_id, value) in enumerate(values):
+            a = self.pool[a_id]
+            if a is not None and self.reuse[a_id]:
+                a.reset(value, budget)
+            else:
+                a = self.classes[a_id](a_id, value, budget)
+                self.pool[a_id] = a
+            agents.append(a)
+        return agents
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+
+# Streaming aggregation of sweep results.
+#
+# Everything is kept as running moments, so memory doesn't grow with the
+# number of iterations, and the current estimates can be written out after
+# every iteration.
+
+import json
+import math
+
+# Two-sided 95% normal quantile
+Z_95 = 1.959963984540054
+
+
+class RunningMoments:
+    """Running mean and variance of a stream of numbers (Welford's method)."""
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / float(self.n)
+        self.m2 += delta * (x - self.mean)
+
+    def variance(self):
+        """Population variance, like util.stddev squared."""
+        if self.n == 0:
+            return 0.0
+        return self.m2 / self.n
+
+    def stddev(self):
+        return math.sqrt(self.variance())
+
+    def stderr(self):
+        """Standard error of the mean, or None with fewer than 2 samples."""
+        if self.n < 2:
+            return None
+        return math.sqrt(self.m2 / (self.n - 1) / self.n)
+
+    def ci95(self):
+        """95% confidence interval for the mean, or None."""
+        se = self.stderr()
+        if se is None:
+            return None
+        return (self.mean - Z_95 * se, self.mean + Z_95 * se)
+
+    def summary(self):
+        return {'n': self.n, 'mean': self.mean, 'stddev': self.stddev(),
+                'stderr': self.stderr(), 'ci95': self.ci95()}
+
+
+class SweepAggregator:
+    """
+    Running estimates for a sweep: average daily revenue, and each agent's
+    average daily utility and spend.  Each iteration (value draw) adds one
+    sample of each, averaged over its permutations.  Amounts are in cents.
+    """
+    def __init__(self, agent_names, out=None):
+        """If out is a file, a JSON line is written to it per iteration."""
+        self.agent_names = agent_names
+        self.revenue = RunningMoments()
+        self.utility = [RunningMoments() for a in agent_names]
+        self.spend = [RunningMoments() for a in agent_names]
+        self.out = out
+
+    def add_iteration(self, i, values, revenue, utilities, spent):
+        """
+        Add iteration i, with value draw values, given the per-permutation
+        averages of revenue and of each agent's utility and spend.
+        """
+        self.revenue.add(revenue)
+        for a in range(len(self.agent_names)):
+            self.utility[a].add(utilities[a])
+            self.spend[a].add(spent[a])
+
+        if self.out is not None:
+            record = {'iteration': i,
+                      'values': values,
+                      'revenue': revenue,
+                      'utility': utilities,
+                      'spend': spent,
+                      'running': self.summary()}
+            self.out.write(json.dumps(record) + "\n")
+            self.out.flush()
+
+    def converged(self, tolerance):
+        """
+        True once the standard errors of revenue and of every agent's
+        utility are at most tolerance.
+        """
+        for m in [self.revenue] + self.utility:
+            se = m.stderr()
+            if se is None or se > tolerance:
+                return False
+        return True
+
+    def summary(self):
+        return {'revenue': self.revenue.summary(),
+                'agents': [{'id': a,
+                            'class': name,
+                            'utility': self.utility[a].summary(),
+                            'spend': self.spend[a].summary()}
+                           for (a, name) in enumerate(self.agent_names)]}
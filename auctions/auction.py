@@ -9,40 +9,39 @@
 
 from optparse import OptionParser
 import copy
+import inspect
 import itertools
 import logging
 import math
+import multiprocessing
 import pprint
 import random
 import sys
+import time
 
+from agent import AgentPool
 from gsp import GSP
 from vcg import VCG
-from history import History
-from stats import Stats
+from history import CompactHistory, SpendLedger
+from stats import RunningTotals, Stats
+from columnar import ColumnarStore, ColumnarHistory
+from market import MarketContext
+from aggregate import SweepAggregator
+from cache import SimCache
+from clicks import CLICK_MODELS, TRAFFIC_MODELS, click_model_for
+from profiling import NULL_PROFILER, Profiler, timer
+from latency import BidLatency
+from traces import TraceWriter
+from remote import RemoteAgent, collect_bids, is_remote, remote_class
+from symmetry import (class_groups, distinct_assignments, group_average,
+                      num_assignments)
+from lockstep import can_lockstep, lockstep_perms, np
 
 #from bbagent import BBAgent
 #from truthfulagent import TruthfulAgent
 
 from util import argmax_index, shuffled, mean, stddev
 
-# Infinite stream of zeros
-zeros = itertools.repeat(0)
-
-def iround(x):
-    """Round x and return an int"""
-    return int(round(x))
-
-def agent_slot(occupants, a_id, t):
-    """Return the slot agent with id a_id occupied in round t,
-    or -1 if a_id wasn't present in round t"""
-    agents = occupants[t]
-    if a_id in agents:
-        return agents.index(a_id)
-    else:
-        return -1
-
-
 def sim(config):
     agents = init_agents(config)
     # Uncomment to print agents.
@@ -50,8 +49,6 @@ def sim(config):
     #    logging.info(a)
 
     n = len(agents)
-    by_id = dict((a.id, a) for a in agents)
-    agent_ids = [a.id for a in agents]
 
     if (config.mechanism.lower() == 'gsp' or
         config.mechanism.lower() == 'switch'):
@@ -68,74 +65,128 @@ def sim(config):
     slot_clicks = {}
     per_click_payments = {}
     slot_payments = {}
-    values = {}
     bids = {}
 
-    history = History(bids, slot_occupants, slot_clicks,
-                      per_click_payments, slot_payments, n)
+    ##   Number of slots.  Using a fixed count keeps the columnar store
+    ##   rectangular.
+    #num_slots = max(1, active_bidders-1)
+    num_slots = max(1, n-1)
 
-    def total_spent(agent_id, end):
-        """
-        Compute total amount spent by agent_id through (not including)
-        round end.
-        """
-        s = 0
-        for t in range(end):
-            slot = agent_slot(slot_occupants, agent_id, t)
-            if slot != -1:
-                s += slot_payments[t][slot]
-        return s
-
-    def run_round(top_slot_clicks, t):
-        """ top_slot_clicks is the expected number of clicks in the top slot
-            k is the round number
+    # Clicks per slot in every round, shared by every simulation of config
+    click_model = click_model_for(config, num_slots)
+
+    if getattr(config, 'columnar', False):
+        store = ColumnarStore(n, num_slots, config.num_rounds)
+        history = ColumnarHistory(bids, slot_occupants, slot_clicks,
+                                  per_click_payments, slot_payments, n, store)
+    else:
+        store = None
+        # Rounds are packed into arrays as they finish; History, which
+        # keeps them all as lists, can be asked for to compare memory use.
+        history_class = getattr(config, 'history_class', CompactHistory)
+        history = history_class(bids, slot_occupants, slot_clicks,
+                                per_click_payments, slot_payments, n)
+    history.click_model = click_model
+    # Running spend per agent, charged once per allocation in run_round
+    ledger = SpendLedger(n, config.budget)
+    # Running utility, clicks and revenue, for Stats
+    totals = RunningTotals(dict((a.id, a.value) for a in agents), ledger)
+    history.totals = totals
+
+    # Agents whose bid() takes the shared market context
+    takes_market = [takes_market_context(a) for a in agents]
+    share_market = any(takes_market)
+
+    # With --profile, time each phase of a round, and bids by agent class
+    profiler = getattr(config, 'profiler', None) or NULL_PROFILER
+    bid_phases = ["sim/bid %s" % name for name in config.agent_class_names]
+
+    # With --bid-latency, time every bid call.  Agents that go over the time
+    # budget with --reuse-slow-bids are benched: their last bid is repeated
+    # without calling them for the rest of the simulation.
+    latency = getattr(config, 'bid_latency', None)
+    last_bids = {}
+    benched = set()
+
+    # Remote agents are asked for their bids all at once at the start of
+    # each round; their bid calls then return what came back.
+    remote_agents = [a for a in agents if isinstance(a, RemoteAgent)]
+    remote_deadline = 0.001 * getattr(config, 'remote_deadline', 1000)
+
+    def timed_bid(a, f, args, initial):
+        if a.id in benched:
+            return last_bids[a.id]
+        start = timer()
+        b = f(*args)
+        if latency.record(a.id, timer() - start, initial) and latency.reuse:
+            benched.add(a.id)
+            latency.benched[a.id] += 1
+            # The late bid is dropped, if there is an earlier one
+            b = last_bids.get(a.id, b)
+        last_bids[a.id] = b
+        return b
+
+    def run_round(t, market):
+        """ t is the round number
+            market is the MarketContext of the previous round, if any agent
+            wants it
         """
+        if remote_agents:
+            collect_bids(remote_agents, t, history, reserve, remote_deadline)
+            profiler.lap("sim/remote bids")
         if t == 0:
-            bids[t] = [(a.id, a.initial_bid(reserve)) for a in agents]
+            initial_bids = []
+            for (a, phase) in zip(agents, bid_phases):
+                if latency is None:
+                    b = a.initial_bid(reserve)
+                else:
+                    b = timed_bid(a, a.initial_bid, (reserve,), True)
+                initial_bids.append((a.id, b))
+                profiler.lap(phase)
+            bids[t] = initial_bids
         else:
             # Bids from agents with no money get reduced to zero
-            have_money = lambda a: total_spent(a.id, t) < config.budget
-            still_have_money = filter(have_money, agents)
             current_bids = []
-            for a in agents:
-                b = a.bid(t, history, reserve)
-                if total_spent(a.id, t) < config.budget:
+            for (a, with_market, phase) in zip(agents, takes_market,
+                                               bid_phases):
+                if with_market:
+                    args = (t, history, reserve, market)
+                else:
+                    args = (t, history, reserve)
+                if latency is None:
+                    b = a.bid(*args)
+                else:
+                    b = timed_bid(a, a.bid, args, False)
+                if ledger.has_money(a.id):
                     current_bids.append( (a.id, b))
                 else:
                     # Out of money: make bid zero.
                     current_bids.append( (a.id, 0))
+                profiler.lap(phase)
             bids[t] = current_bids
 
-        ##   Ignore those below reserve price
-        active_bidders = len(filter(lambda (i,b): b >= reserve, bids[t]))
-        #####################################
-        ##   1a.   Define no. of slots 
-        #num_slots = max(1, active_bidders-1) 
-        num_slots = max(1, n-1) 
-       
-        ##   1b.  Calculate clicks/slot
-        slot_clicks[t] = [iround(top_slot_clicks * pow(config.dropoff, i))
-                          for i in range(num_slots)]
+        ##   1.  Calculate clicks/slot
+        slot_clicks[t] = list(click_model.clicks(t))
+        profiler.lap("sim/clicks")
                           
         ##  2. Run mechanism and allocate slots
         (slot_occupants[t], per_click_payments[t]) = (
             mechanism.compute(slot_clicks[t],
                               reserve, bids[t]))
+        profiler.lap("sim/mechanism")
         
         ##  3. Define payments
         slot_payments[t] = map(lambda (x,y): x*y,
                                zip(slot_clicks[t], per_click_payments[t]))
+        profiler.lap("sim/payments")
+        ledger.record(slot_occupants[t], slot_payments[t])
+        profiler.lap("sim/spend")
                                
-        ##  4.  Save utility (misnamed as values)
-        values[t] = dict(zip(agent_ids, zeros))
-        
-        def agent_value(agent_id, clicks, payment):
-            if agent_id is not None:
-                values[t][agent_id] = by_id[agent_id].value * clicks - payment
-            return None
-        
-        map(agent_value, slot_occupants[t], slot_clicks[t], slot_payments[t])
-        
+        ##  4.  Add up utility, clicks and revenue
+        totals.record(slot_occupants[t], slot_clicks[t],
+                      per_click_payments[t], slot_payments[t])
+        profiler.lap("sim/utility")
+
         ## Debugging. Set to True to see what's happening.
         log_console = False
         if log_console:
@@ -146,24 +197,26 @@ def sim(config):
             logging.info("\tslot_clicks: %s" % slot_clicks[t])
             logging.info("\tper_click_payments: %s" % per_click_payments[t])
             logging.info("\tslot_payments: %s" % slot_payments[t])
-            logging.info("\tUtility: %s" % values[t])
-            logging.info("\ttotals spent: %s" % [total_spent(a.id, t+1) for a in agents])
+            logging.info("\ttotal utility: %s" % totals.utility)
+            logging.info("\ttotals spent: %s" % ledger.totals)
             
     
+    market = None
     for t in range(0, config.num_rounds):
-        # Over 48 rounds, go from 80 to 20 and back to 80.  Mean 50.
-        # Makes sense when 48 rounds, to simulate a day
-        top_slot_clicks = iround(30*math.cos(math.pi*t/24) + 50)
-
         if t == config.num_rounds / 2 and config.mechanism == 'switch':
             mechanism = VCG
         ##   0.  Runs one round
-        run_round(top_slot_clicks, t)
-        for a in agents:
-            history.set_agent_spent(a.id, total_spent(a.id, t))
+        profiler.mark()
+        run_round(t, market)
+        if share_market:
+            market = MarketContext(bids[t], slot_clicks[t], reserve)
+            profiler.lap("sim/market context")
+        history.finish_round(t)
+        # Agents see spend through the round before the one just run.
+        history.agents_spent = ledger.previous
+        profiler.lap("sim/history")
     
-    for a in agents:
-        history.set_agent_spent(a.id, total_spent(a.id, config.num_rounds))
+    history.agents_spent = list(ledger.totals)
     
     return history
 
@@ -179,46 +232,235 @@ class Params:
                          for k in self.__dict__.keys() if k not in self._init_keys)
         
 
+def takes_market_context(agent):
+    """True if agent.bid() has a market argument for the MarketContext."""
+    return 'market' in inspect.getargspec(agent.bid).args
+
+# class name -> agent class, loaded once per process
+_loaded_classes = {}
+
 def load_modules(agent_classes):
-    """Each agent class must be in module class_name.lower().
+    """Each agent class must be in module class_name.lower(), except
+    remote agents, named remote@ADDRESS (see remote.py).
     Returns a dictionary class_name->class"""
 
     def load(class_name):
-        module_name = class_name.lower()  # by convention / fiat
-        module = __import__(module_name)
-        agent_class = module.__dict__[class_name]
+        agent_class = _loaded_classes.get(class_name)
+        if agent_class is None:
+            if is_remote(class_name):
+                agent_class = remote_class(class_name)
+            else:
+                module_name = class_name.lower()  # by convention / fiat
+                module = __import__(module_name)
+                agent_class = module.__dict__[class_name]
+            _loaded_classes[class_name] = agent_class
         return (class_name, agent_class)
 
     return dict(map(load, agent_classes))
     
 
 def init_agents(conf):
-    """Each agent class must be already loaded, and have a
-    constructor that takes an id, a value, and a budget, in that order."""
-#    params = [(0, 10, conf.budget), (1, 20, conf.budget), (2, 30, conf.budget)]
-    n = len(conf.agent_class_names)
-    params = zip(range(n), conf.agent_values, itertools.repeat(conf.budget))
-    def load(class_name, params):
-        agent_class = conf.agent_classes[class_name]
-        return agent_class(*params)
-
-    return map(load, conf.agent_class_names, params)
+    """
+    Each agent class must be already loaded, and have a constructor that
+    takes an id, a value, and a budget, in that order.  Agents are kept in
+    conf.agent_pool, and reset for the next simulation if their class
+    allows it.
+    """
+    pool = getattr(conf, 'agent_pool', None)
+    if pool is None or not pool.matches(conf.agent_class_names,
+                                        conf.agent_classes):
+        pool = AgentPool(conf.agent_class_names, conf.agent_classes)
+        conf.agent_pool = pool
+    return pool.agents(conf.agent_values, conf.budget)
+
+def run_perm(options, vals, seed):
+    """
+    Simulate one assignment of values to agents, with the random module
+    seeded with seed so the result doesn't depend on what ran before.
+    The caller's random state is left as it was.
+    Returns (utilities, spent, revenue), with one utility and spend per agent.
+
+    With a cache in options.cache, results are looked up there first, and
+    stored along with the simulation's rounds.  With a TraceWriter in
+    options.trace, the rounds are added to the trace.
+    """
+    trace = getattr(options, 'trace', None)
+    cache = getattr(options, 'cache', None)
+    if cache is not None:
+        key = cache.key(options, vals, seed)
+        entry = cache.get(key)
+        if entry is not None:
+            if trace is not None:
+                trace.add(entry['rounds'], vals, seed)
+            return entry['stats']
+
+    state = random.getstate()
+    random.seed(seed)
+    n = len(vals)
+    options.agent_values = list(vals)
+    try:
+        ##   Runs simulation  ###
+        history = sim(options)
+        ###  simulation ends.
+    finally:
+        random.setstate(state)
+    profiler = getattr(options, 'profiler', None) or NULL_PROFILER
+    profiler.mark()
+    stats = Stats(history, dict(zip(range(n), vals)))
+    # Print stats in console?
+    # logging.info(stats)
+    if getattr(options, 'verify_stats', False):
+        check_stats(stats)
+    result = ([stats.total_utility(id) for id in range(n)],
+              list(history.agents_spent),
+              stats.total_revenue())
+    profiler.lap("run_perm/stats")
+    if cache is not None or trace is not None:
+        rounds = [tuple(history.round(t))
+                  for t in range(history.num_rounds())]
+        if cache is not None:
+            cache.put(key, {'stats': result, 'rounds': rounds})
+        if trace is not None:
+            trace.add(rounds, vals, seed)
+    return result
+
+def check_stats(stats):
+    """Compare the running totals in stats with a replay of the history."""
+    replayed = Stats(stats.history, stats.values, replay=True)
+    for id in stats.values:
+        for name in ['total_utility', 'total_clicks', 'total_spent']:
+            kept = getattr(stats, name)(id)
+            recomputed = getattr(replayed, name)(id)
+            if kept != recomputed:
+                raise RuntimeError("%s(%d) is %s, but replay gives %s" % (
+                    name, id, kept, recomputed))
+    if stats.total_revenue() != replayed.total_revenue():
+        raise RuntimeError("total_revenue() is %s, but replay gives %s" % (
+            stats.total_revenue(), replayed.total_revenue()))
+
+# Options for the simulations run by this process
+_task_options = None
+
+def _init_tasks(options):
+    global _task_options
+    _task_options = options
+
+def _run_task(task):
+    """
+    Run a (vals, seed) task.  A task can also be (vals, seed, settings),
+    with a dict of options that differ from task to task (like the reserve
+    in reserve.py); they are set on this process's options for the task
+    only.  (Not on a copy of the options, which would lose the click model
+    cached in them.)
+    """
+    (vals, seed) = task[:2]
+    if len(task) == 2:
+        return run_perm(_task_options, vals, seed)
+    saved = dict((name, getattr(_task_options, name)) for name in task[2])
+    try:
+        for (name, value) in task[2].items():
+            setattr(_task_options, name, value)
+        return run_perm(_task_options, vals, seed)
+    finally:
+        for (name, value) in saved.items():
+            setattr(_task_options, name, value)
+
+def _monitors(options):
+    """
+    The profiler and bid latencies in options, if any.  Worker processes
+    have their own copies, and send back what they recorded with each
+    result.
+    """
+    return [m for m in [getattr(options, 'profiler', None),
+                        getattr(options, 'bid_latency', None)]
+            if m is not None]
+
+def _run_monitored_task(task):
+    """_run_task, also returning what the monitors recorded."""
+    result = _run_task(task)
+    return (result, [m.take() for m in _monitors(_task_options)])
+
+def _merge_monitors(monitors, results):
+    for (result, taken) in results:
+        for (m, recorded) in zip(monitors, taken):
+            m.merge(recorded)
+        yield result
+
+def perm_results(pool, workers, tasks):
+    """
+    Run the (vals, seed) tasks, in the pool if there is one.  Results come
+    back in task order, so sums over them don't depend on the worker count.
+    """
+    if pool is None:
+        return itertools.imap(_run_task, tasks)
+    chunksize = max(1, len(tasks) // (4 * workers))
+    monitors = _monitors(_task_options)
+    if monitors:
+        return _merge_monitors(monitors, pool.imap(_run_monitored_task, tasks,
+                                                   chunksize))
+    return pool.imap(_run_task, tasks, chunksize)
+
+def iteration_tasks(values, options, approx, groups=None):
+    """
+    The (vals, seed) tasks of an iteration with value draw values, and the
+    weight of each: one task per permutation of values; or, if approx,
+    per --perms samples of them; or with groups (see --dedup), per
+    distinct value assignment, weighted by how many permutations it stands
+    for.  Every permutation gets its own seed, drawn here, so the results
+    are the same however many workers run them.
+    """
+    if groups is not None:
+        (perms, weights) = zip(*distinct_assignments(values, groups))
+    elif approx:
+        perms = [shuffled(values) for j in range(options.max_perms)]
+        weights = itertools.repeat(1)
+    else:
+        perms = itertools.permutations(values)
+        weights = itertools.repeat(1)
+    tasks = [(list(vals), random.getrandbits(32)) for vals in perms]
+    return (tasks, weights)
 
 def get_utils(n, options):
     m = options.min_val
     M = options.max_val
     return [random.randint(m, M) for i in range(n)]
 
+def dollars(cents):
+    """Format an amount in cents, which may be None, as dollars."""
+    if cents is None:
+        return "n/a"
+    return "$%.2f" % (0.01 * cents)
+
+def dollar_range(interval):
+    if interval is None:
+        return "n/a"
+    return "[%s, %s]" % tuple(dollars(x) for x in interval)
+
+# The handler added by configure_logging(), which only adds one however
+# many times it is called (bench.py runs main() over and over)
+_log_handler = None
+
+def report_profile(profiler, wall_time, json_path=None):
+    """Log the profiler's report, and write it to json_path if given."""
+    logging.info("")
+    logging.info("%s\t\t%s\t\t%s" % ("#" * 15, "PROFILE", "#" * 15))
+    for line in profiler.report(wall_time):
+        logging.info(line)
+    if json_path is not None:
+        profiler.write_json(json_path, wall_time)
+
 def configure_logging(loglevel):
+    global _log_handler
     numeric_level = getattr(logging, loglevel.upper(), None)
     if not isinstance(numeric_level, int):
         raise ValueError('Invalid log level: %s' % loglevel)
 
     root_logger = logging.getLogger('')
-    strm_out = logging.StreamHandler(sys.__stdout__)
-    strm_out.setFormatter(logging.Formatter('%(message)s'))
+    if _log_handler is None:
+        _log_handler = logging.StreamHandler(sys.__stdout__)
+        _log_handler.setFormatter(logging.Formatter('%(message)s'))
+        root_logger.addHandler(_log_handler)
     root_logger.setLevel(numeric_level)
-    root_logger.addHandler(strm_out)
 
 def parse_agents(args):
     """
@@ -239,15 +481,12 @@ def parse_agents(args):
             raise ValueError("Bad argument: %s\n" % c)
     return ans
 
-def main(args):
+def make_parser():
+    """The command line options of a sweep."""
 
     usage_msg = "Usage:  %prog [options] PeerClass1[,cnt] PeerClass2[,cnt2] ..."
     parser = OptionParser(usage=usage_msg)
 
-    def usage(msg):
-        print "Error: %s\n" % msg
-        parser.print_help()
-        sys.exit()
     
     parser.add_option("--loglevel",
                       dest="loglevel", default="info",
@@ -285,13 +524,108 @@ def main(args):
                       dest="iters", default=1, type="int",
                       help="Number of different value draws to sample. Set to 1 for debugging.")
 
+    parser.add_option("--click-model",
+                      dest="click_model_name", default="geometric",
+                      help="Position effects: %s.  'empirical' reads relative click-through rates per slot from --ctr-file" % " or ".join(CLICK_MODELS))
+
+    parser.add_option("--traffic",
+                      dest="traffic", default="cosine",
+                      help="Traffic curve over the rounds: %s" % " or ".join(TRAFFIC_MODELS))
+
+    parser.add_option("--ctr-file",
+                      dest="ctr_file", default=None,
+                      help="File of relative click-through rates, one row per round (repeated as needed) and one column per slot")
+
+    parser.add_option("--columnar",
+                      dest="columnar", default=False, action="store_true",
+                      help="Keep history in NumPy arrays (for very long simulations)")
+
+    parser.add_option("--workers",
+                      dest="workers", default=1, type="int",
+                      help="Number of processes to run simulations in")
+
+    parser.add_option("--lockstep",
+                      dest="lockstep", default=False, action="store_true",
+                      help="Simulate all permutations of a value draw together, if every agent class is vectorizable")
+
+    parser.add_option("--verify-stats",
+                      dest="verify_stats", default=False, action="store_true",
+                      help="Check the running stats against a replay of each simulation")
+
+    parser.add_option("--jsonl",
+                      dest="jsonl", default=None,
+                      help="Write running results to this file, one JSON line per iteration")
+
+    parser.add_option("--tolerance",
+                      dest="tolerance", default=None, type="float",
+                      help="Keep drawing values until the standard errors of average daily revenue and of every agent's utility are below this many cents.  --iters becomes the minimum number of draws.  Needs a --max-iters or --time-budget")
+
+    parser.add_option("--max-iters",
+                      dest="max_iters", default=None, type="int",
+                      help="With --tolerance, stop after this many value draws regardless")
+
+    parser.add_option("--time-budget",
+                      dest="time_budget", default=None, type="float",
+                      help="Stop drawing values after this many seconds")
+
+    parser.add_option("--dedup",
+                      dest="dedup", default=False, action="store_true",
+                      help="Only simulate value assignments that differ by more than swapping values between agents of the same class, weighted by how many permutations each stands for")
+
+    parser.add_option("--cache-dir",
+                      dest="cache_dir", default=None,
+                      help="Cache simulation results in this directory, and reuse them.  Cached simulations aren't run again, so they don't show up in --profile or --bid-latency times.  Not used with --bid-time-budget, whose results depend on timing")
+
+    parser.add_option("--cache-size",
+                      dest="cache_size", default=512, type="int",
+                      help="Maximum size of the cache, in MB")
+
+    parser.add_option("--profile",
+                      dest="profile", default=False, action="store_true",
+                      help="Time each phase of the simulation and print a summary at the end")
+
+    parser.add_option("--profile-json",
+                      dest="profile_json", default=None,
+                      help="With --profile, also write the phase times to this JSON file")
+
+    parser.add_option("--bid-latency",
+                      dest="bid_latency", default=False, action="store_true",
+                      help="Time every initial_bid() and bid() call, and report each agent's latencies")
+
+    parser.add_option("--remote-deadline",
+                      dest="remote_deadline", default=1000, type="float",
+                      help="Milliseconds to wait for the bids of remote agents each round.  Late agents keep their previous bid")
+
+    parser.add_option("--bid-time-budget",
+                      dest="bid_time_budget", default=None, type="float",
+                      help="Flag bid calls that take longer than this many milliseconds.  Implies --bid-latency")
+
+    parser.add_option("--reuse-slow-bids",
+                      dest="reuse_slow_bids", default=False, action="store_true",
+                      help="Once an agent goes over --bid-time-budget, stop calling it for the rest of the simulation and repeat its previous bid.  Results then depend on timing")
+
+    parser.add_option("--trace",
+                      dest="trace_dir", default=None,
+                      help="Save every simulation's rounds to a binary trace in this directory (see traces.py)")
+
+    parser.add_option("--trace-shard-rounds",
+                      dest="trace_shard_rounds", default=65536, type="int",
+                      help="Rounds per trace shard file")
+
     parser.add_option("--seed",
                       dest="seed", default=None, type="int",
                       help="seed for random numbers")
 
+    return parser
 
-    (options, args) = parser.parse_args()
-
+def configure(options, args):
+    """
+    Finish setting up parsed options for simulations.  args are the agent
+    class names (three Truthful agents if there are none); they are loaded,
+    along with the click model, and the cache, bid latencies, trace and
+    profiler the options ask for.  Returns the list of agent class names.
+    Raises ValueError for bad arguments.
+    """
     # leftover args are class names:
     # e.g. "Truthful BBAgent CleverBidder Fred"
 
@@ -301,24 +635,95 @@ def main(args):
     else:
         agents_to_run = parse_agents(args)
 
+    # Add some more config options
+    options.agent_class_names = agents_to_run
+    options.agent_classes = load_modules(options.agent_class_names)
+    options.dropoff = 0.75
+    click_model_for(options, max(1, len(agents_to_run) - 1))
+    if options.cache_dir is not None and any(map(is_remote, agents_to_run)):
+        raise ValueError("remote agents can't be cached")
+    if options.cache_dir is not None and options.bid_time_budget is not None:
+        logging.warning("Results with --bid-time-budget depend on timing: "
+                        "not caching them")
+    elif options.cache_dir is not None:
+        options.cache = SimCache(options.cache_dir,
+                                 options.cache_size * 1024 * 1024)
+    if options.reuse_slow_bids and options.bid_time_budget is None:
+        raise ValueError("--reuse-slow-bids needs a --bid-time-budget")
+    if (options.tolerance is not None and options.max_iters is None and
+        options.time_budget is None):
+        # A sweep that never converges would run forever
+        raise ValueError("--tolerance needs a --max-iters or --time-budget")
+    if options.bid_latency or options.bid_time_budget is not None:
+        if options.bid_time_budget is None:
+            budget = None
+        else:
+            budget = 0.001 * options.bid_time_budget
+        options.bid_latency = BidLatency(len(agents_to_run), budget,
+                                         options.reuse_slow_bids)
+    else:
+        options.bid_latency = None
+    if options.trace_dir is not None:
+        options.trace = TraceWriter(options.trace_dir, agents_to_run,
+                                    max(1, len(agents_to_run) - 1),
+                                    options.trace_shard_rounds)
+    else:
+        options.trace = None
+    if options.profile or options.profile_json is not None:
+        options.profiler = Profiler()
+    else:
+        options.profiler = None
+    return agents_to_run
+
+def main(args):
+    parser = make_parser()
+
+    def usage(msg):
+        print "Error: %s\n" % msg
+        parser.print_help()
+        sys.exit()
+
+    (options, args) = parser.parse_args(args[1:])
+
     configure_logging(options.loglevel)
 
     if options.seed != None:
         random.seed(options.seed)
 
-    # Add some more config options
-    options.agent_class_names = agents_to_run
-    options.agent_classes = load_modules(options.agent_class_names)
-    options.dropoff = 0.75
+    try:
+        agents_to_run = configure(options, args)
+    except (ValueError, IOError) as e:
+        usage(str(e))
+    latency = options.bid_latency
+    profiler = options.profiler or NULL_PROFILER
 
     logging.info("Starting simulation...")
     n = len(agents_to_run)
 
     totals = dict((id, 0) for id in range(n))
-    total_revenues = []
+    if options.jsonl is not None:
+        jsonl = open(options.jsonl, 'w')
+    else:
+        jsonl = None
+    aggregator = SweepAggregator(agents_to_run, jsonl)
+
+    ## With --dedup, simulate one value assignment per class of assignments
+    ## that only differ by swapping values between agents of the same class.
+    groups = class_groups(agents_to_run)
+    dedup = False
+    if options.dedup:
+        if num_assignments(groups) <= options.max_perms:
+            dedup = True
+        else:
+            logging.warning("Too many distinct value assignments to "
+                            "enumerate: sampling permutations instead")
 
-    approx = math.factorial(n) > options.max_perms
-    if approx:
+    approx = math.factorial(n) > options.max_perms and not dedup
+    if dedup:
+        num_perms = math.factorial(n)
+        logging.info("Running up to %d distinct value assignments out of %d "
+                     "permutations" % (num_assignments(groups), num_perms))
+    elif approx:
         num_perms = options.max_perms
         logging.warning(
             "Running approximation: taking %d samples of value permutations"
@@ -329,52 +734,137 @@ def main(args):
     av_value=range(0,n)
     total_spent = [0 for i in range(n)]
 
+    lockstep = False
+    if options.lockstep and latency is not None:
+        logging.warning("Bid latencies need one bid call per agent: "
+                        "simulating permutations one by one")
+    elif options.lockstep and options.trace is not None:
+        logging.warning("Traces need every simulation's history: "
+                        "simulating permutations one by one")
+    elif options.lockstep:
+        lockstep = can_lockstep(options.agent_classes.values())
+        if not lockstep:
+            logging.warning("Not every agent class is vectorizable (or numpy "
+                            "is missing): simulating permutations one by one")
+
+    _init_tasks(options)
+    if lockstep:
+        pool = None
+    elif options.workers > 1:
+        pool = multiprocessing.Pool(options.workers, _init_tasks, (options,))
+    else:
+        pool = None
+
+    start_time = time.time()
+    start_timer = timer()
+    def keep_sampling(i):
+        """Whether to run iteration i"""
+        if (i > 0 and options.time_budget is not None and
+            time.time() - start_time >= options.time_budget):
+            logging.warning("Time budget used up after %d iterations" % i)
+            return False
+        if options.tolerance is None:
+            return i < options.iters
+        if i < max(2, options.iters):
+            return True
+        if aggregator.converged(options.tolerance):
+            logging.info("Standard errors below $%.2f after %d iterations" % (
+                0.01 * options.tolerance, i))
+            return False
+        return options.max_iters is None or i < options.max_iters
+
+    if options.tolerance is None:
+        iters_label = str(options.iters)
+    else:
+        iters_label = "?"
+
     ##  iters = no. of samples to take
-    for i in range(options.iters):
+    i = 0
+    while keep_sampling(i):
+        draw_start = timer()
         values = get_utils(n, options)
-        logging.info("==== Iteration %d / %d.  Values %s ====" % (i, options.iters, values))
+        logging.info("==== Iteration %d / %s.  Values %s ====" % (i, iters_label, values))
         ## Create permutations (permutes the random values, and assigns them to agents)
-        if approx:
-            perms = [shuffled(values) for i in range(options.max_perms)]
+        (tasks, weights) = iteration_tasks(values, options, approx,
+                                           groups if dedup else None)
+        perms_start = timer()
+        profiler.add("main/draw values", perms_start - draw_start)
+
+        if lockstep:
+            # Seeded from the permutations' seeds, so the random module
+            # draws the same values as without --lockstep
+            rng = np.random.RandomState([seed for (_, seed) in tasks])
+            results = lockstep_perms(options, [v for (v, _) in tasks], rng)
         else:
-            perms = itertools.permutations(values)
+            results = perm_results(pool, options.workers, tasks)
 
         total_rev = 0
+        iter_utils = [0 for id in range(n)]
+        iter_spent = [0 for id in range(n)]
         ## Iterate over permutations
-        for vals in perms:
-            options.agent_values = list(vals)
-            values = dict(zip(range(n), list(vals)))
-            ##   Runs simulation  ###
-            history = sim(options)
-            ###  simulation ends.
-            stats = Stats(history, values)
-            # Print stats in console?
-            # logging.info(stats)
-            
+        for ((utils, spent, rev), weight) in itertools.izip(results, weights):
+            if dedup:
+                ## This stands for weight permutations, in which each agent
+                ## is equally likely to be in any of its group's positions.
+                utils = [weight * u for u in group_average(utils, groups)]
+                spent = [weight * s for s in group_average(spent, groups)]
+                rev = weight * rev
             for id in range(n):
-                totals[id] += stats.total_utility(id)
-                total_spent[id] += history.agents_spent[id]
-            total_rev += stats.total_revenue()
-        total_revenues.append(total_rev / float(num_perms))
+                totals[id] += utils[id]
+                total_spent[id] += spent[id]
+                iter_utils[id] += utils[id]
+                iter_spent[id] += spent[id]
+            total_rev += rev
+        aggregate_start = timer()
+        profiler.add("main/permutations", aggregate_start - perms_start)
+        aggregator.add_iteration(
+            i, values, total_rev / float(num_perms),
+            [u / float(num_perms) for u in iter_utils],
+            [s / float(num_perms) for s in iter_spent])
+        logging.debug("Average daily revenue so far: $%.2f (stderr %s)" % (
+            0.01 * aggregator.revenue.mean,
+            dollars(aggregator.revenue.stderr())))
+        profiler.add("main/aggregate", timer() - aggregate_start)
+        i += 1
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+    if jsonl is not None:
+        jsonl.close()
+    if options.trace is not None:
+        options.trace.close()
 
     ## total_spent = total amount of money spent by agents, for all iterations, all permutations, all rounds
     
 
     # Averages are over all the value permutations considered    
-    N = float(num_perms) * options.iters
+    N = float(num_perms) * aggregator.revenue.n
     logging.info("%s\t\t%s\t\t%s" % ("#" * 15, "RESULTS", "#" * 15))
     logging.info("")
     for a in range(n):
         logging.info("Stats for Agent %d, %s" % (a, agents_to_run[a]) )
         logging.info("Average spend $%.2f (daily)" % (0.01 *total_spent[a]/N)  )   
         logging.info("Average  utility  $%.2f (daily)" % (0.01 * totals[a]/N))
+        logging.info("Utility 95%% CI %s, spend 95%% CI %s" % (
+            dollar_range(aggregator.utility[a].ci95()),
+            dollar_range(aggregator.spend[a].ci95())))
+        if latency is not None:
+            for line in latency.report(a):
+                logging.info(line)
         logging.info("-" * 40)
         logging.info("\n")
-    m = mean(total_revenues)
-    std = stddev(total_revenues)
+    m = aggregator.revenue.mean
+    std = aggregator.revenue.stddev()
     logging.warning("Average daily revenue (stddev): $%.2f ($%.2f)" % (0.01 * m, 0.01*std))
+    logging.info("Average daily revenue stderr %s, 95%% CI %s" % (
+        dollars(aggregator.revenue.stderr()),
+        dollar_range(aggregator.revenue.ci95())))
     t = logging.info("TOTAL AVG UTILITY: $%.2f" % (mean([0.01 * totals[a]/N for a in range(n)])))
 
+    if profiler.enabled:
+        report_profile(profiler, timer() - start_timer, options.profile_json)
+
 #print "config", config.budget
     
 
@@ -2,21 +2,19 @@
 
 import sys
 
+from agent import Agent
 from gsp import GSP
 from util import argmax_index
 
-class BBAgent:
+class BBAgent(Agent):
     """Balanced bidding agent"""
-    def __init__(self, id, value, budget):
-        self.id = id
-        self.value = value
-        self.budget = budget
+    __slots__ = ()
 
     def initial_bid(self, reserve):
         return self.value / 2
 
 
-    def slot_info(self, t, history, reserve):
+    def slot_info(self, t, history, reserve, market=None):
         """Compute the following for each slot, assuming that everyone else
         keeps their bids constant from the previous rounds.
 
@@ -25,13 +23,21 @@ class BBAgent:
         in the last round.  If slot_id = 0, max_bid is 2* min_bid.
         Otherwise, it's the next highest min_bid (so bidding between min_bid
         and max_bid would result in ending up in that slot)
-        """
-        prev_round = history.round(t-1)
-        other_bids = filter(lambda (a_id, b): a_id != self.id, prev_round.bids)
 
-        clicks = prev_round.clicks
+        If the simulator passes in the MarketContext for the previous round,
+        the slot prices come from there instead.
+        """
+        if market is not None:
+            clicks = market.clicks
+            ranges = market.bid_ranges(self.id)
+        else:
+            prev_round = history.round(t-1)
+            other_bids = filter(lambda (a_id, b): a_id != self.id,
+                                prev_round.bids)
+            clicks = prev_round.clicks
+            ranges = GSP.bid_ranges(clicks, reserve, other_bids)
         def compute(s):
-            (min, max) = GSP.bid_range_for_slot(s, clicks, reserve, other_bids)
+            (min, max) = ranges[s]
             if max == None:
                 max = 2 * min
             return (s, min, max)
@@ -41,11 +47,12 @@ class BBAgent:
         return info
 
 
-    def expected_utils(self, t, history, reserve):
+    def expected_utils(self, t, history, reserve, market=None, info=None):
         """
         Figure out the expected utility of bidding such that we win each
         slot, assuming that everyone else keeps their bids constant from
-        the previous round.
+        the previous round.  info is the slot_info() of this round, if it
+        was already computed.
 
         returns a list of utilities per slot.
         """
@@ -55,7 +62,7 @@ class BBAgent:
         
         return utilities
 
-    def target_slot(self, t, history, reserve):
+    def target_slot(self, t, history, reserve, market=None, info=None):
         """Figure out the best slot to target, assuming that everyone else
         keeps their bids constant from the previous rounds.
 
@@ -63,11 +70,13 @@ class BBAgent:
         the other-agent bid for that slot in the last round.  If slot_id = 0,
         max_bid is min_bid * 2
         """
-        i =  argmax_index(self.expected_utils(t, history, reserve))
-        info = self.slot_info(t, history, reserve)
+        if info is None:
+            info = self.slot_info(t, history, reserve, market)
+        i =  argmax_index(self.expected_utils(t, history, reserve, market,
+                                              info))
         return info[i]
 
-    def bid(self, t, history, reserve):
+    def bid(self, t, history, reserve, market=None):
         # The Balanced bidding strategy (BB) is the strategy for a player j that, given
         # bids b_{-j},
         # - targets the slot s*_j which maximizes his utility, that is,
@@ -79,15 +88,11 @@ class BBAgent:
         # If s*_j is the top slot, bid the value v_j
 
         prev_round = history.round(t-1)
-        (slot, min_bid, max_bid) = self.target_slot(t, history, reserve)
+        info = self.slot_info(t, history, reserve, market)
+        (slot, min_bid, max_bid) = self.target_slot(t, history, reserve,
+                                                    market, info)
 
         # TODO: Fill this in.
         bid = 0  # change this
         
         return bid
-
-    def __repr__(self):
-        return "%s(id=%d, value=%d)" % (
-            self.__class__.__name__, self.id, self.value)
-
-
@@ -0,0 +1,476 @@
+#!/usr/bin/env python
+
+# Benchmarks for the auction simulator.
+#
+# Usage:  python bench.py [options] [benchmark ...]
+#
+# Every benchmark runs for each combination of --agents and --num-rounds
+# (comma-separated lists, or --grid for the full scaling grid).  Results can
+# be written as JSON with --json, and compared with an earlier --json file
+# with --baseline; slowdowns past --threshold are reported as regressions.
+
+from optparse import OptionParser
+import Queue
+import copy
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import sys
+import time
+import timeit
+
+import auction
+import gsp
+from auction import Params, init_agents, load_modules, sim
+from gsp import GSP
+from history import CompactHistory, History
+from market import MarketContext
+from stats import Stats
+from vcg import VCG
+
+# The scaling grid of --grid
+GRID_AGENTS = [3, 10, 30, 100, 300, 1000]
+GRID_ROUNDS = [48, 480, 4800, 48000, 100000]
+
+# Units of benchmark results, and how to print them
+UNITS = {'s': lambda v: "%12.3f ms" % (1000 * v),
+         'MB': lambda v: "%12.1f MB" % v}
+
+# Agent classes for the simulation benchmarks, used round-robin
+DEFAULT_CLASSES = 'Truthful,rwjlbb,rwjlbudget_cos,rwjlbudget_jacob'
+
+
+class DeepcopyRoundHistory:
+    """The old RoundHistory, which deep-copied every list on each access."""
+    def __init__(self, bids, occupants, clicks,
+                 per_click_payments, slot_payments):
+        self.bids = copy.deepcopy(bids)
+        self.occupants = copy.deepcopy(occupants)
+        self.clicks = copy.deepcopy(clicks)
+        self.per_click_payments = copy.deepcopy(per_click_payments)
+        self.slot_payments = copy.deepcopy(slot_payments)
+
+
+def fake_rounds(n_agents, num_rounds):
+    """Random round data shaped like what sim() records."""
+    num_slots = max(1, n_agents - 1)
+    bids = {}
+    occupants = {}
+    clicks = {}
+    per_click_payments = {}
+    slot_payments = {}
+    for t in range(num_rounds):
+        bids[t] = [(i, random.randint(25, 175)) for i in range(n_agents)]
+        occupants[t] = random.sample(range(n_agents), num_slots)
+        clicks[t] = [int(round(50 * pow(0.75, i))) for i in range(num_slots)]
+        per_click_payments[t] = [random.randint(25, 175)
+                                 for i in range(num_slots)]
+        slot_payments[t] = [c * p for (c, p) in
+                            zip(clicks[t], per_click_payments[t])]
+    return (bids, occupants, clicks, per_click_payments, slot_payments)
+
+
+def best_time(f, repeat, number=1):
+    """Best time of repeat runs of number calls to f, per call."""
+    return min(timeit.repeat(f, number=number, repeat=repeat)) / number
+
+
+def sim_config(n_agents, num_rounds, class_names, seed=0):
+    """A sim() configuration with n_agents agents and random values."""
+    names = [class_names[i % len(class_names)] for i in range(n_agents)]
+    rng = random.Random(seed)
+    config = Params()
+    config.add('agent_class_names', names)
+    config.add('agent_classes', load_modules(set(names)))
+    config.add('agent_values', [rng.randint(25, 175) for name in names])
+    config.add('budget', 500000)
+    config.add('mechanism', 'gsp')
+    config.add('reserve', 0)
+    config.add('num_rounds', num_rounds)
+    config.add('dropoff', 0.75)
+    return config
+
+
+def bench_history(n_agents, num_rounds, repeat, options):
+    """
+    Time the access pattern of a simulation: every agent reads the previous
+    round a few times per bid.  Compares shared RoundHistory records with
+    the old deepcopy-per-access path.
+    """
+    data = fake_rounds(n_agents, num_rounds)
+    reads_per_bid = 4
+
+    def shared():
+        history = History(*(data + (n_agents,)))
+        for t in range(1, num_rounds):
+            history.finish_round(t - 1)
+            for a in range(n_agents * reads_per_bid):
+                history.round(t - 1).bids
+
+    def deepcopied():
+        for t in range(1, num_rounds):
+            for a in range(n_agents * reads_per_bid):
+                DeepcopyRoundHistory(*[d[t - 1] for d in data]).bids
+
+    return [("history.round (shared)", min(timeit.repeat(shared, number=1,
+                                                         repeat=repeat))),
+            ("history.round (deepcopy)", min(timeit.repeat(deepcopied,
+                                                           number=1,
+                                                           repeat=repeat)))]
+
+
+def bench_gsp_batch(n_agents, num_rounds, repeat, options):
+    """
+    Run num_rounds auctions with n_agents bidders each, one GSP.compute call
+    per auction versus a single GSP.compute_batch call.
+    """
+    import numpy as np
+
+    num_slots = max(1, n_agents - 1)
+    slot_clicks = [int(round(50 * pow(0.75, i))) for i in range(num_slots)]
+    bid_matrix = np.random.RandomState(0).randint(25, 176,
+                                                  (num_rounds, n_agents))
+    bid_lists = [zip(range(n_agents), row) for row in bid_matrix.tolist()]
+
+    def scalar():
+        for bids in bid_lists:
+            GSP.compute(slot_clicks, 0, bids)
+
+    def batched():
+        GSP.compute_batch(slot_clicks, 0, bid_matrix)
+
+    return [("GSP.compute (loop)", min(timeit.repeat(scalar, number=1,
+                                                     repeat=repeat))),
+            ("GSP.compute_batch", min(timeit.repeat(batched, number=1,
+                                                    repeat=repeat)))]
+
+
+def bench_mechanisms(n_agents, num_rounds, repeat, options):
+    """Time one call of GSP.compute, VCG.compute and
+    GSP.bid_range_for_slot."""
+    num_slots = max(1, n_agents - 1)
+    slot_clicks = [int(round(50 * pow(0.75, i))) for i in range(num_slots)]
+    bids = [(i, random.randint(25, 175)) for i in range(n_agents)]
+    # Enough calls to take a measurable time at every size
+    number = max(1, 2000 // n_agents)
+
+    return [("GSP.compute", best_time(
+                lambda: GSP.compute(slot_clicks, 0, bids), repeat, number)),
+            ("VCG.compute", best_time(
+                lambda: VCG.compute(slot_clicks, 0, bids), repeat, number)),
+            ("GSP.bid_range_for_slot", best_time(
+                lambda: GSP.bid_range_for_slot(num_slots // 2, slot_clicks,
+                                               0, bids),
+                repeat, number))]
+
+
+def bench_large_market(n_agents, num_rounds, repeat, options):
+    """
+    Time GSP.compute and VCG.compute with n_agents bidders and only 5
+    slots, ranking just the top bids (as they do in large markets) versus
+    shuffling and sorting every bid.
+    """
+    slot_clicks = [int(round(50 * pow(0.75, i))) for i in range(5)]
+    bids = [(i, random.randint(25, 175)) for i in range(n_agents)]
+
+    def full_sort(f):
+        large_market = gsp.LARGE_MARKET
+        gsp.LARGE_MARKET = float('inf')
+        try:
+            f(slot_clicks, 0, bids)
+        finally:
+            gsp.LARGE_MARKET = large_market
+
+    results = []
+    for mechanism in [GSP, VCG]:
+        name = mechanism.__name__
+        results.append(("%s.compute (5 slots)" % name, best_time(
+            lambda: mechanism.compute(slot_clicks, 0, bids), repeat)))
+        results.append(("%s.compute (5 slots, full sort)" % name, best_time(
+            lambda: full_sort(mechanism.compute), repeat)))
+    return results
+
+
+def bench_agents(n_agents, num_rounds, repeat, options):
+    """Time one bid() of each agent class in an n_agents market, after one
+    round.  With fewer agents than classes, only the first n_agents classes
+    are in the market."""
+    class_names = options.classes.split(',')
+    config = sim_config(n_agents, 1, class_names)
+    history = sim(config)
+    r = history.round(0)
+    market = MarketContext(r.bids, r.clicks, config.reserve)
+    agents = init_agents(config)
+    number = max(1, 200 // n_agents)
+
+    results = []
+    for name in class_names[:n_agents]:
+        a = agents[config.agent_class_names.index(name)]
+        if auction.takes_market_context(a):
+            f = lambda: a.bid(1, history, config.reserve, market)
+        else:
+            f = lambda: a.bid(1, history, config.reserve)
+        results.append(("%s.bid" % name, best_time(f, repeat, number)))
+    return results
+
+
+def bench_setup(n_agents, num_rounds, repeat, options):
+    """Time getting the agents of a simulation ready: constructing new
+    ones, and resetting the ones in the agent pool."""
+    config = sim_config(n_agents, 1, options.classes.split(','))
+    number = max(1, 2000 // n_agents)
+
+    def construct():
+        config.agent_pool = None
+        init_agents(config)
+
+    return [("init_agents (construct)", best_time(construct, repeat, number)),
+            ("init_agents (reset)", best_time(lambda: init_agents(config),
+                                              repeat, number))]
+
+
+def bench_stats(n_agents, num_rounds, repeat, options):
+    """Time the Stats totals of every agent, from the simulator's running
+    totals and by replaying the history."""
+    config = sim_config(n_agents, num_rounds, ['Truthful'])
+    history = sim(config)
+    values = dict(enumerate(config.agent_values))
+
+    def totals(replay):
+        stats = Stats(history, values, replay)
+        for id in values:
+            stats.total_utility(id)
+            stats.total_spent(id)
+        stats.total_revenue()
+
+    return [("Stats (running totals)", best_time(lambda: totals(False),
+                                                 repeat)),
+            ("Stats (replay)", best_time(lambda: totals(True), repeat))]
+
+
+def bench_sim(n_agents, num_rounds, repeat, options):
+    """Time one sim() of num_rounds rounds."""
+    config = sim_config(n_agents, num_rounds, options.classes.split(','))
+    return [("sim", best_time(lambda: sim(config), repeat))]
+
+
+def bench_sweep(n_agents, num_rounds, repeat, options):
+    """Time auction.main() sweeping a few permutations of one value draw."""
+    class_names = options.classes.split(',')
+    args = ['auction.py', '--loglevel', 'error', '--seed', '0',
+            '--num-rounds', str(num_rounds), '--iters', '1', '--perms', '4']
+    args.extend(class_names[i % len(class_names)] for i in range(n_agents))
+    return [("auction.main", best_time(lambda: auction.main(args), repeat))]
+
+
+def peak_rss():
+    """Peak resident set size of this process, in MB (Linux reports kB)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _sim_memory(config, queue):
+    start = peak_rss()
+    sim(config)
+    queue.put((start, peak_rss()))
+
+
+def child_result(p, queue, poll=1.0):
+    """What process p puts on queue.  Raises RuntimeError if p exits
+    without putting anything there."""
+    while True:
+        try:
+            return queue.get(timeout=poll)
+        except Queue.Empty:
+            if not p.is_alive():
+                p.join()
+                raise RuntimeError("benchmark process exited with code %s" %
+                                   p.exitcode)
+
+
+def bench_memory(n_agents, num_rounds, repeat, options):
+    """
+    Peak RSS of one sim() of Truthful agents, keeping every round as lists
+    (History, as before) or packed into arrays (CompactHistory, the default)
+    or NumPy columns (--columnar).  Each runs in a fresh process, and the
+    growth over that process's starting peak is reported.
+    """
+    results = []
+    for (label, history_class, columnar) in [
+            ("History", History, False),
+            ("CompactHistory", CompactHistory, False),
+            ("ColumnarHistory", None, True)]:
+        config = sim_config(n_agents, num_rounds, ['Truthful'])
+        if columnar:
+            config.add('columnar', True)
+        else:
+            config.add('history_class', history_class)
+        queue = multiprocessing.Queue()
+        p = multiprocessing.Process(target=_sim_memory, args=(config, queue))
+        p.start()
+        (start, peak) = child_result(p, queue)
+        p.join()
+        results.append(("peak RSS growth, %s" % label, peak - start, 'MB'))
+    return results
+
+
+# name -> (benchmark, cost).  A benchmark is called as
+# f(n_agents, num_rounds, repeat, options) and returns a list of
+# (label, seconds) or (label, value, unit), with a unit from UNITS.
+# cost(n_agents, num_rounds) is a rough estimate of its
+# running time in microseconds, to skip sizes that would take too long;
+# benchmarks that don't depend on the number of rounds have a cost of None,
+# and run once per number of agents.
+BENCHMARKS = {
+    'history': (bench_history, lambda n, r: 30 * n * n * r),
+    'gsp_batch': (bench_gsp_batch, lambda n, r: 2 * n * r),
+    'mechanisms': (bench_mechanisms, None),
+    'large_market': (bench_large_market, None),
+    'agents': (bench_agents, None),
+    'setup': (bench_setup, None),
+    'stats': (bench_stats, lambda n, r: 8 * n * r),
+    'sim': (bench_sim, lambda n, r: 2 * n * n * r),
+    'sweep': (bench_sweep, lambda n, r: 8 * n * n * r),
+    'memory': (bench_memory, lambda n, r: 12 * n * r),
+}
+
+
+def int_list(s):
+    return [int(x) for x in s.split(',')]
+
+
+def result_key(r):
+    return (r['benchmark'], r['label'], r['n_agents'], r['num_rounds'])
+
+
+def compare(baseline, results, threshold):
+    """
+    Compare results with the results of a baseline run (both lists of
+    result dicts).  Returns a list of (result, baseline value, ratio,
+    regressed) for the results the baseline also has, where regressed means
+    more than threshold (a fraction) slower, or bigger.
+    """
+    before = dict((result_key(r), r['value']) for r in baseline)
+    report = []
+    for r in results:
+        old = before.get(result_key(r))
+        if old is None:
+            continue
+        ratio = r['value'] / old if old > 0 else float('inf')
+        report.append((r, old, ratio, ratio > 1 + threshold))
+    return report
+
+
+def main(args):
+    usage_msg = "Usage:  %prog [options] [benchmark ...]"
+    parser = OptionParser(usage=usage_msg)
+
+    parser.add_option("--agents",
+                      dest="n_agents", default="10",
+                      help="Numbers of agents, separated by commas")
+
+    parser.add_option("--num-rounds",
+                      dest="num_rounds", default="48",
+                      help="Numbers of rounds, separated by commas")
+
+    parser.add_option("--grid",
+                      dest="grid", default=False, action="store_true",
+                      help="Run every benchmark over the full scaling grid: %s agents, %s rounds" % (GRID_AGENTS, GRID_ROUNDS))
+
+    parser.add_option("--max-seconds",
+                      dest="max_seconds", default=60, type="float",
+                      help="Skip sizes that would take more than about this many seconds per run")
+
+    parser.add_option("--classes",
+                      dest="classes", default=DEFAULT_CLASSES,
+                      help="Agent classes to simulate, separated by commas")
+
+    parser.add_option("--repeat",
+                      dest="repeat", default=5, type="int",
+                      help="Take the best of this many runs")
+
+    parser.add_option("--json",
+                      dest="json", default=None,
+                      help="Write the results to this file as JSON")
+
+    parser.add_option("--baseline",
+                      dest="baseline", default=None,
+                      help="Compare with the results in this JSON file")
+
+    parser.add_option("--threshold",
+                      dest="threshold", default=0.2, type="float",
+                      help="Fraction by which a result can be slower than the baseline before it counts as a regression")
+
+    parser.add_option("--seed",
+                      dest="seed", default=0, type="int",
+                      help="seed for random numbers")
+
+    (options, names) = parser.parse_args(args[1:])
+    if not names:
+        names = sorted(BENCHMARKS.keys())
+    for name in names:
+        if name not in BENCHMARKS:
+            print "Error: unknown benchmark %s\n" % name
+            parser.print_help()
+            sys.exit(1)
+
+    if options.grid:
+        agent_counts = GRID_AGENTS
+        round_counts = GRID_ROUNDS
+    else:
+        agent_counts = int_list(options.n_agents)
+        round_counts = int_list(options.num_rounds)
+
+    results = []
+    for name in names:
+        (f, cost) = BENCHMARKS[name]
+        for n_agents in agent_counts:
+            for num_rounds in (round_counts if cost is not None else [None]):
+                if (cost is not None and
+                    cost(n_agents, num_rounds) > 1e6 * options.max_seconds):
+                    print "%-36s %7d agents %6d rounds      skipped" % (
+                        name, n_agents, num_rounds)
+                    continue
+                random.seed(options.seed)
+                for result in f(n_agents, num_rounds, options.repeat,
+                                options):
+                    (label, value, unit) = (result + ('s',))[:3]
+                    print "%-36s %7d agents %6s rounds %s" % (
+                        label, n_agents, num_rounds or '-', UNITS[unit](value))
+                    results.append({'benchmark': name,
+                                    'label': label,
+                                    'n_agents': n_agents,
+                                    'num_rounds': num_rounds,
+                                    'value': value,
+                                    'unit': unit})
+
+    if options.json is not None:
+        with open(options.json, 'w') as f:
+            json.dump({'time': time.time(),
+                       'python': platform.python_version(),
+                       'platform': platform.platform(),
+                       'repeat': options.repeat,
+                       'seed': options.seed,
+                       'results': results}, f, indent=1)
+
+    if options.baseline is not None:
+        with open(options.baseline) as f:
+            baseline = json.load(f)['results']
+        report = compare(baseline, results, options.threshold)
+        print
+        print "Compared with %s:" % options.baseline
+        regressions = 0
+        for (r, old, ratio, regressed) in report:
+            fmt = UNITS[r['unit']]
+            print "%-36s %7d agents %6s rounds %s -> %s  x%.2f%s" % (
+                r['label'], r['n_agents'], r['num_rounds'] or '-', fmt(old),
+                fmt(r['value']), ratio, "  REGRESSION" if regressed else "")
+            regressions += regressed
+        if regressions:
+            print "%d regressions" % regressions
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+# Content-addressed on-disk cache of simulation results.
+#
+# A simulation is fully determined by its configuration (agents, values,
+# reserve, budget, mechanism, rounds, seed, ...) and the code that runs it,
+# so results are stored under a hash of both and reused by later sweeps.
+
+import ast
+import cPickle as pickle
+import hashlib
+import imp
+import json
+import os
+import tempfile
+
+from clicks import click_model_for
+
+# Modules whose code decides a simulation's outcome, besides the agents'.
+# The modules these and the agents' modules import are added to them.
+SIMULATOR_MODULES = ['auction', 'agent', 'gsp', 'vcg', 'history', 'stats',
+                     'market', 'columnar', 'latency', 'clicks', 'lockstep',
+                     'util']
+
+# module name -> (sha1 of its source, the local modules it imports),
+# computed once per process
+_sources = {}
+
+def local_imports(source, path):
+    """
+    Names of the modules imported by source, the code of the module at
+    path, that are Python files in the same directory: the project's own
+    modules, not the standard library's or installed packages'.
+    """
+    imported = set()
+    for node in ast.walk(ast.parse(source, path)):
+        if isinstance(node, ast.Import):
+            imported.update(a.name.split('.')[0] for a in node.names)
+        elif (isinstance(node, ast.ImportFrom) and node.module and
+              not node.level):
+            imported.add(node.module.split('.')[0])
+    local = []
+    for name in sorted(imported):
+        try:
+            (f, _, (_, _, kind)) = imp.find_module(name,
+                                                   [os.path.dirname(path)])
+        except ImportError:
+            continue
+        if f is not None:
+            f.close()
+        if kind == imp.PY_SOURCE:
+            local.append(name)
+    return local
+
+def module_source(module_name):
+    """(sha1 of the source file of a module on the path, local_imports())"""
+    entry = _sources.get(module_name)
+    if entry is None:
+        (f, path, _) = imp.find_module(module_name)
+        with f:
+            source = f.read()
+        entry = (hashlib.sha1(source).hexdigest(), local_imports(source, path))
+        _sources[module_name] = entry
+    return entry
+
+def source_hashes(module_names):
+    """
+    module name -> sha1 of the source of the given modules and of every local
+    module they import, directly or not.
+    """
+    hashes = {}
+    todo = list(module_names)
+    while todo:
+        name = todo.pop()
+        if name not in hashes:
+            (hashes[name], imported) = module_source(name)
+            todo.extend(imported)
+    return hashes
+
+
+def sim_config(options, vals, seed):
+    """Everything that determines the outcome of sim(), as a dict."""
+    agent_modules = sorted(set(options.agent_classes[name].__module__
+                               for name in options.agent_class_names))
+    modules = SIMULATOR_MODULES + agent_modules
+    return {'agents': list(options.agent_class_names),
+            'values': list(vals),
+            'reserve': options.reserve,
+            'budget': options.budget,
+            'mechanism': options.mechanism,
+            'num_rounds': options.num_rounds,
+            'dropoff': options.dropoff,
+            'clicks': click_model_for(options, max(1, len(vals) - 1)).digest(),
+            'columnar': getattr(options, 'columnar', False),
+            'seed': seed,
+            'sources': source_hashes(modules)}
+
+
+class SimCache:
+    """
+    Stores one pickled entry per simulation in directory, named by the sha1
+    of its configuration.  Once the files take up more than max_bytes, the
+    least recently used ones are deleted.
+    """
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.size = sum(size for (_, _, size) in self.entries())
+
+    def key(self, options, vals, seed):
+        config = sim_config(options, vals, seed)
+        return hashlib.sha1(json.dumps(config, sort_keys=True)).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.pkl')
+
+    def get(self, key):
+        """The entry stored under key, or None."""
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as f:
+                entry = pickle.load(f)
+        except Exception:
+            # Missing, truncated, or written by code that has changed since:
+            # simulate it again
+            return None
+        try:
+            # Mark as recently used
+            os.utime(path, None)
+        except OSError:
+            pass
+        return entry
+
+    def put(self, key, entry):
+        path = self.path(key)
+        subdir = os.path.dirname(path)
+        if not os.path.isdir(subdir):
+            try:
+                os.makedirs(subdir)
+            except OSError:
+                # Another process made it first
+                pass
+        # Write to a temporary file and rename, so readers (and other worker
+        # processes) never see half an entry.
+        (fd, tmp) = tempfile.mkstemp(dir=subdir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+        try:
+            # An entry being replaced no longer counts
+            self.size -= os.path.getsize(path)
+        except OSError:
+            pass
+        os.rename(tmp, path)
+        self.size += os.path.getsize(path)
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def entries(self):
+        """(last use, path, size) of every entry."""
+        found = []
+        for (dirpath, _, filenames) in os.walk(self.directory):
+            for name in filenames:
+                if not name.endswith('.pkl'):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                found.append((st.st_mtime, path, st.st_size))
+        return found
+
+    def evict(self):
+        """Delete least recently used entries until under max_bytes."""
+        entries = sorted(self.entries())
+        self.size = sum(size for (_, _, size) in entries)
+        for (_, path, size) in entries:
+            if self.size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                # Already evicted by another process
+                pass
+            self.size -= size
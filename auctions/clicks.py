@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+
+# Click models: how many clicks each slot gets in each round.
+#
+# A model is a traffic curve (the expected clicks of the top slot in round
+# t) times position effects (the fraction of those clicks each slot gets).
+# The rounds x slots matrix is computed once per configuration, and then
+# shared by every simulation and agent, which look rounds up in O(1).
+
+import hashlib
+import math
+import re
+
+# Cascade model: a user looks at the slots from the top, clicks the ad in
+# the slot they're looking at with probability CASCADE_CLICK, and otherwise
+# goes on to the next slot with probability CASCADE_CONTINUE.
+CASCADE_CLICK = 0.3
+CASCADE_CONTINUE = 0.9
+
+CLICK_MODELS = ['geometric', 'cascade', 'empirical']
+TRAFFIC_MODELS = ['cosine', 'flat']
+
+
+def iround(x):
+    """Round x and return an int"""
+    return int(round(x))
+
+
+def cosine_traffic(t):
+    """Over 48 rounds, go from 80 to 20 and back to 80.  Mean 50.
+    Makes sense when 48 rounds, to simulate a day."""
+    return 30*math.cos(math.pi*t/24) + 50
+
+
+def flat_traffic(t):
+    return 50
+
+
+def geometric_positions(num_slots, dropoff):
+    """Each slot gets dropoff times the clicks of the one above it."""
+    return [pow(dropoff, i) for i in range(num_slots)]
+
+
+def cascade_positions(num_slots, click=CASCADE_CLICK,
+                      cont=CASCADE_CONTINUE):
+    """Chance that a user gets to each slot, relative to the top one."""
+    effects = []
+    reach = 1.0
+    for i in range(num_slots):
+        effects.append(reach)
+        reach *= (1 - click) * cont
+    return effects
+
+
+def load_ctr_table(path):
+    """
+    Read relative click-through rates from a file: one row of numbers per
+    line, separated by commas or whitespace, one number per slot.  Blank
+    lines and lines starting with # are skipped.
+    """
+    rows = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            rows.append([float(x) for x in re.split(r'[,\s]+', line)])
+    if not rows:
+        raise ValueError("no click-through rates in %s" % path)
+    return rows
+
+
+class ClickModel:
+    """
+    The clicks of every slot in every round.  traffic is a function of the
+    round giving the top slot's expected clicks, and positions a function
+    of the round giving each slot's fraction of them.  Slots past the end of
+    positions get no clicks.
+    """
+    # The make_click_model() arguments it was built from, if it was
+    args = None
+
+    def __init__(self, num_rounds, num_slots, traffic, positions):
+        self.num_rounds = num_rounds
+        self.num_slots = num_slots
+        self._traffic = [traffic(t) for t in range(num_rounds)]
+        self.rows = []
+        for t in range(num_rounds):
+            top_slot_clicks = iround(self._traffic[t])
+            effects = list(positions(t))[:num_slots]
+            effects.extend([0] * (num_slots - len(effects)))
+            self.rows.append(tuple(iround(top_slot_clicks * e)
+                                   for e in effects))
+        self._sum_future()
+
+    @classmethod
+    def from_rows(cls, traffic, rows):
+        """
+        The ClickModel with the given top slot traffic and clicks in each
+        round, e.g. as sent to a remote agent.
+        """
+        model = cls(0, len(rows[0]) if rows else 0, None, None)
+        model.num_rounds = len(rows)
+        model._traffic = list(traffic)
+        model.rows = [tuple(row) for row in rows]
+        model._sum_future()
+        return model
+
+    def _sum_future(self):
+        # _future[t][s] is the clicks of slot s from round t on
+        self._future = [None] * (self.num_rounds + 1)
+        total = (0,) * self.num_slots
+        self._future[self.num_rounds] = total
+        for t in range(self.num_rounds - 1, -1, -1):
+            total = tuple(a + b for (a, b) in zip(self.rows[t], total))
+            self._future[t] = total
+
+    def clicks(self, t):
+        """The clicks of each slot in round t."""
+        return self.rows[t]
+
+    def traffic(self, t):
+        """The top slot's expected clicks in round t, before rounding."""
+        return self._traffic[t]
+
+    def future_clicks(self, t, slot):
+        """Total clicks of slot in rounds t through the last one."""
+        return self._future[t][slot]
+
+    def digest(self):
+        """sha1 of the click matrix, for cache keys."""
+        if getattr(self, '_digest', None) is None:
+            self._digest = hashlib.sha1(repr(self.rows)).hexdigest()
+        return self._digest
+
+
+def make_click_model(num_rounds, num_slots, model='geometric',
+                     traffic='cosine', dropoff=0.75, ctr_file=None):
+    """
+    Build the ClickModel for a configuration.  model is one of
+    CLICK_MODELS; 'empirical' reads the position effects from ctr_file,
+    whose rows are used for successive rounds, wrapping around.  traffic is
+    one of TRAFFIC_MODELS.
+    """
+    if traffic == 'cosine':
+        traffic_curve = cosine_traffic
+    elif traffic == 'flat':
+        traffic_curve = flat_traffic
+    else:
+        raise ValueError("traffic must be one of %s" % TRAFFIC_MODELS)
+
+    if model == 'geometric':
+        effects = geometric_positions(num_slots, dropoff)
+        positions = lambda t: effects
+    elif model == 'cascade':
+        effects = cascade_positions(num_slots)
+        positions = lambda t: effects
+    elif model == 'empirical':
+        if ctr_file is None:
+            raise ValueError("the empirical click model needs a CTR file")
+        table = load_ctr_table(ctr_file)
+        positions = lambda t: table[t % len(table)]
+    else:
+        raise ValueError("click model must be one of %s" % CLICK_MODELS)
+
+    return ClickModel(num_rounds, num_slots, traffic_curve, positions)
+
+
+def click_model_for(config, num_slots):
+    """
+    The click model of a simulation configuration, built on first use and
+    kept in config.click_model, so every permutation (and every worker
+    process it is sent to) shares it.  It is built again if any of the
+    configuration's click settings have changed since.  A model put in
+    config.click_model by hand is kept as long as its size fits.
+    """
+    args = (config.num_rounds, num_slots,
+            getattr(config, 'click_model_name', 'geometric'),
+            getattr(config, 'traffic', 'cosine'),
+            config.dropoff,
+            getattr(config, 'ctr_file', None))
+    model = getattr(config, 'click_model', None)
+    if model is None:
+        stale = True
+    elif model.args is not None:
+        stale = model.args != args
+    else:
+        stale = (model.num_rounds != config.num_rounds or
+                 model.num_slots != num_slots)
+    if stale:
+        model = make_click_model(*args)
+        model.args = args
+        config.click_model = model
+    return model
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+
+# Columnar, NumPy-backed storage for a simulation's history.
+#
+# Instead of a dict of Python lists per round, every quantity lives in one
+# preallocated array with a row per round, so long simulations don't build
+# millions of small Python objects.
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from history import History, recent_round
+
+
+class ColumnarStore:
+    """
+    Preallocated rounds x agents and rounds x slots arrays for a simulation:
+      bids: bids[t, id] is the bid of agent id in round t
+      occupants: occupants[t, slot] is the id in slot, or -1 if empty
+      clicks, per_click_payments, slot_payments: per round and slot
+
+    Bids and payments (AMOUNTS) are int64, like the ints most agents bid,
+    until a float is recorded in them; from then on that column is float64,
+    and float_entries says which of its entries were floats, so every
+    number comes back as it went in.
+    """
+    AMOUNTS = ('bids', 'per_click_payments', 'slot_payments')
+
+    def __init__(self, n_agents, num_slots, num_rounds):
+        if np is None:
+            raise ImportError("the columnar history store requires numpy")
+        self.n_agents = n_agents
+        self.num_slots = num_slots
+        self.bids = np.zeros((num_rounds, n_agents), dtype=np.int64)
+        self.occupants = np.full((num_rounds, num_slots), -1, dtype=np.int64)
+        self.clicks = np.zeros((num_rounds, num_slots), dtype=np.int64)
+        self.per_click_payments = np.zeros((num_rounds, num_slots),
+                                           dtype=np.int64)
+        self.slot_payments = np.zeros((num_rounds, num_slots), dtype=np.int64)
+        # Which entries of the AMOUNTS columns were recorded as floats
+        self.float_entries = dict(
+            (name, np.zeros(getattr(self, name).shape, dtype=bool))
+            for name in self.AMOUNTS)
+        # Number of allocated slots in each round
+        self.num_allocated = np.zeros(num_rounds, dtype=np.int64)
+        self.num_rounds = 0
+
+    def record(self, t, bids, occupants, clicks,
+               per_click_payments, slot_payments):
+        """Store round t, given in the list form sim() uses."""
+        self.set_amounts('bids', (t, [a_id for (a_id, _) in bids]),
+                         [b for (_, b) in bids])
+        k = len(occupants)
+        self.num_allocated[t] = k
+        self.occupants[t, :k] = occupants
+        self.clicks[t, :len(clicks)] = clicks
+        self.set_amounts('per_click_payments', (t, slice(k)),
+                         per_click_payments)
+        self.set_amounts('slot_payments', (t, slice(k)), slot_payments)
+        self.num_rounds = max(self.num_rounds, t + 1)
+
+    def set_amounts(self, name, index, values):
+        """Store values at index of the AMOUNTS column name, switching it
+        to float64 if any of them is a float."""
+        floats = [isinstance(x, float) for x in values]
+        if any(floats):
+            if getattr(self, name).dtype != np.float64:
+                setattr(self, name, getattr(self, name).astype(np.float64))
+            self.float_entries[name][index] = floats
+        getattr(self, name)[index] = values
+
+    def amounts(self, name, index):
+        """The values at index of the AMOUNTS column name, as a list of the
+        ints and floats they were recorded as."""
+        column = getattr(self, name)
+        values = column[index].tolist()
+        if column.dtype == np.float64:
+            floats = self.float_entries[name][index].tolist()
+            values = [x if f else int(x) for (x, f) in zip(values, floats)]
+        return values
+
+    def round_lists(self, t):
+        """Round t as (bids, occupants, clicks, per_click_payments,
+        slot_payments) lists, like the ones sim() records."""
+        k = self.num_allocated[t]
+        return (list(enumerate(self.amounts('bids', t))),
+                self.occupants[t, :k].tolist(),
+                self.clicks[t].tolist(),
+                self.amounts('per_click_payments', (t, slice(k))),
+                self.amounts('slot_payments', (t, slice(k))))
+
+
+class ColumnarHistory(History):
+    """
+    History backed by a ColumnarStore.  The per-round lists sim() writes are
+    moved into the store when the round finishes.
+    """
+    def __init__(self, bids, occupants, clicks,
+                 per_click_payments, slot_payments, n_agents, store):
+        History.__init__(self, bids, occupants, clicks,
+                         per_click_payments, slot_payments, n_agents)
+        self.store = store
+
+    def finish_round(self, t):
+        self.store.record(t, self._bids.pop(t), self._occupants.pop(t),
+                          self._clicks.pop(t),
+                          self._per_click_payments.pop(t),
+                          self._slot_payments.pop(t))
+        return self.round(t)
+
+    def round(self, t):
+        return recent_round(self, t, self.unpack_round)
+
+    def unpack_round(self, t):
+        return History.RoundHistory(*self.store.round_lists(t))
+
+    def num_rounds(self):
+        return self.store.num_rounds
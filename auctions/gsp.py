@@ -1,7 +1,136 @@
 #!/usr/bin/env python
 
+import heapq
 import random
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def batch_rng(rng=None):
+    """
+    NumPy random state for the batched mechanisms.  Unless one is given,
+    it's seeded from the random module, so --seed covers it too.
+    """
+    if np is None:
+        raise ImportError("batched mechanisms require numpy")
+    if rng is None:
+        rng = np.random.RandomState(random.getrandbits(32))
+    return rng
+
+
+def rank_batch(reserve, bids, width, rng=None):
+    """
+    Rank the bids of many auctions at once.  bids is an (auctions x bidders)
+    array, where the column is the bidder id, and reserve is a scalar or one
+    reserve per auction.
+
+    Each row is sorted from highest to lowest bid, with ties broken uniformly
+    at random and bids below the reserve moved to the end.  Returns
+    (order, sorted_bids, num_valid, reserves), where order and sorted_bids
+    have width columns (padded with -1 and 0 if there are fewer bidders),
+    num_valid is the number of bids at or above the reserve in each auction,
+    and reserves is the reserve of each auction as a column.
+    """
+    rng = batch_rng(rng)
+    bids = np.asarray(bids)
+    (m, n) = bids.shape
+    reserves = np.broadcast_to(reserve, (m,))[:, np.newaxis]
+
+    valid = bids >= reserves
+    keys = np.where(valid, bids, -np.inf)
+    # lexsort sorts by the last key first; the random key breaks ties
+    order = np.lexsort((rng.random_sample((m, n)), -keys), axis=1)
+    rows = np.arange(m)[:, np.newaxis]
+    sorted_bids = bids[rows, order]
+
+    if n < width:
+        order = np.hstack([order, np.full((m, width - n), -1, order.dtype)])
+        sorted_bids = np.hstack(
+            [sorted_bids, np.zeros((m, width - n), sorted_bids.dtype)])
+    return (order[:, :width], sorted_bids[:, :width], valid.sum(axis=1),
+            reserves)
+
+
+# Markets with at least this many bids, and this many times more bids than
+# slots, only rank the bids that can matter.  sim() has one fewer slot than
+# bidders, so it always ranks every bid.
+LARGE_MARKET = 1000
+LARGE_MARKET_RATIO = 16
+
+
+def is_large_market(num_bids, num_slots):
+    return (num_bids >= LARGE_MARKET and
+            num_bids > LARGE_MARKET_RATIO * (num_slots + 1))
+
+
+def cutoff_bid(amounts, k):
+    """
+    The k'th highest of amounts, for 0 < k <= len(amounts).  Integer bids
+    within a range no wider than their number are counted into buckets, in
+    O(n); anything else goes through a heap, in O(n log k).
+    """
+    lo = min(amounts)
+    hi = max(amounts)
+    if hi - lo <= len(amounts):
+        counts = [0] * (int(hi - lo) + 1)
+        try:
+            for b in amounts:
+                counts[b - lo] += 1
+        except TypeError:
+            # Not all integers
+            pass
+        else:
+            seen = 0
+            for i in xrange(len(counts) - 1, -1, -1):
+                seen += counts[i]
+                if seen >= k:
+                    return lo + i
+    return heapq.nlargest(k, amounts)[-1]
+
+
+def top_bids(reserve, bids, k):
+    """
+    The k highest (id, bid) tuples at or above reserve, highest first, as
+    if all the valid bids were shuffled and then sorted: bidders tied at the
+    cutoff are picked uniformly at random, and ties are ordered at random.
+    Only the bids at or above the cutoff are shuffled and sorted.
+    """
+    valid_bids = [(a, b) for (a, b) in bids if b >= reserve]
+    if len(valid_bids) <= k:
+        candidates = valid_bids
+    else:
+        cutoff = cutoff_bid([b for (_, b) in valid_bids], k)
+        candidates = [(a, b) for (a, b) in valid_bids if b > cutoff]
+        tied = [(a, b) for (a, b) in valid_bids if b == cutoff]
+        candidates.extend(random.sample(tied, k - len(candidates)))
+    random.shuffle(candidates)
+    candidates.sort(key=lambda (a, b): b, reverse=True)
+    return candidates
+
+
+def ranked_bids(reserve, bids, num_slots):
+    """
+    The (id, bid) tuples at or above reserve, sorted from highest to lowest
+    bid with ties broken at random.  In a large market, only the top
+    num_slots + 1 (the winners and the price setter) are returned.
+    """
+    if is_large_market(len(bids), num_slots):
+        return top_bids(reserve, bids, num_slots + 1)
+
+    valid = lambda (a, bid): bid >= reserve
+    valid_bids = filter(valid, bids)
+
+    rev_cmp_bids = lambda (a1, b1), (a2, b2): cmp(b2, b1)
+    # shuffle first to make sure we don't have any bias for lower or
+    # higher ids
+    random.shuffle(valid_bids)
+    valid_bids.sort(rev_cmp_bids)
+    return valid_bids
+
+
 class GSP:
     """
     Implements the generalized second price auction mechanism.
@@ -23,16 +152,8 @@ class GSP:
             (in order)
          - per_click_payments is the corresponding payments.
         """
-        valid = lambda (a, bid): bid >= reserve
-        valid_bids = filter(valid, bids)
-
-        rev_cmp_bids = lambda (a1, b1), (a2, b2): cmp(b2, b1)
-        # shuffle first to make sure we don't have any bias for lower or
-        # higher ids
-        random.shuffle(valid_bids)
-        valid_bids.sort(rev_cmp_bids)
-
         num_slots = len(slot_clicks)
+        valid_bids = ranked_bids(reserve, bids, num_slots)
         allocated_bids = valid_bids[:num_slots]
         if len(allocated_bids) == 0:
             return ([], [])
@@ -50,6 +171,34 @@ class GSP:
         per_click_payments.append(last_payment)
         return (list(allocation), per_click_payments)
 
+    @staticmethod
+    def compute_batch(slot_clicks, reserve, bids, rng=None):
+        """
+        Run many auctions at once.  bids is an (auctions x bidders) array of
+        bids, where the column is the bidder id, slot_clicks is the clicks
+        for each slot (or one such row per auction), and reserve is a scalar
+        or one reserve per auction.  rng is an optional
+        numpy.random.RandomState used to break ties.
+
+        Returns a pair of (auctions x slots) arrays
+        (allocation, per_click_payments), one row per auction laid out like
+        the lists compute() returns.  Slots nobody fills hold -1 in
+        allocation and 0 in per_click_payments.
+        """
+        num_slots = np.shape(slot_clicks)[-1]
+        (order, sorted_bids, num_valid, reserves) = rank_batch(
+            reserve, bids, num_slots + 1, rng)
+
+        slots = np.arange(num_slots)
+        filled = slots < num_valid[:, np.newaxis]
+        allocation = np.where(filled, order[:, :num_slots], -1)
+
+        # Each pays the bid below them, or the reserve
+        priced = slots + 1 < num_valid[:, np.newaxis]
+        per_click_payments = np.where(priced, sorted_bids[:, 1:], reserves)
+        per_click_payments = np.where(filled, per_click_payments, 0)
+        return (allocation, per_click_payments)
+
     @staticmethod
     def bid_range_for_slot(slot, slot_clicks, reserve, bids):
         """
@@ -58,10 +207,30 @@ class GSP:
         Returns a tuple (min_bid, max_bid).
         If slot == 0, returns None for max_bid, since it's not well defined.
         """
+        return GSP.slot_range(slot, GSP.sorted_bids(reserve, bids), reserve)
+
+    @staticmethod
+    def bid_ranges(slot_clicks, reserve, bids):
+        """
+        Like bid_range_for_slot, for every slot at once: returns a list with
+        the (min_bid, max_bid) of each slot in slot_clicks.  The bids are
+        only sorted once.
+        """
+        bid_amounts = GSP.sorted_bids(reserve, bids)
+        return [GSP.slot_range(slot, bid_amounts, reserve)
+                for slot in range(len(slot_clicks))]
+
+    @staticmethod
+    def sorted_bids(reserve, bids):
+        """The bid amounts at or above reserve, highest first."""
         bid_amounts = [b for (_, b) in bids if b >= reserve]
         bid_amounts.sort()
         bid_amounts.reverse()
+        return bid_amounts
 
+    @staticmethod
+    def slot_range(slot, bid_amounts, reserve):
+        """(min_bid, max_bid) for slot, given the output of sorted_bids."""
         n = len(bid_amounts)
         if slot >= n:
             # More than reserve, less than smallest bid
@@ -74,4 +243,3 @@ class GSP:
         min_bid = bid_amounts[slot]
         max_bid = bid_amounts[slot-1] if slot > 0 else None
         return (min_bid, max_bid)
-
@@ -1,38 +1,184 @@
 #!/usr/bin/env python
 
-import copy
+from array import array
+from collections import namedtuple
+
+_RoundFields = namedtuple('RoundHistory', ['bids', 'occupants', 'clicks',
+                                           'per_click_payments',
+                                           'slot_payments'])
 
 class History:
-    class RoundHistory:
+    class RoundHistory(_RoundFields):
         """
         Allows agents to access the history of a previous round.
-        Makes copies so clients can't change history.
+        Everything is stored in tuples so clients can't change history, and
+        the same record can be handed to every agent without copying.
         """
-        def __init__(self, bids, occupants, clicks,
-                     per_click_payments, slot_payments):
+        __slots__ = ()
+
+        def __new__(cls, bids, occupants, clicks,
+                    per_click_payments, slot_payments):
             """Takes the info for a _single_ round."""
-            self.bids = copy.deepcopy(bids)
-            self.occupants = copy.deepcopy(occupants)
-            self.clicks = copy.deepcopy(clicks)
-            self.per_click_payments = copy.deepcopy(per_click_payments)
-            self.slot_payments = copy.deepcopy(slot_payments)
+            return _RoundFields.__new__(cls,
+                                        tuple(map(tuple, bids)),
+                                        tuple(occupants),
+                                        tuple(clicks),
+                                        tuple(per_click_payments),
+                                        tuple(slot_payments))
 
     def __init__(self, bids, occupants, clicks,
                  per_click_payments, slot_payments, n_agents=3):
-        self.round = lambda t: History.RoundHistory(
-            bids[t], occupants[t],
-            clicks[t], per_click_payments[t],
-            slot_payments[t])
+        self._bids = bids
+        self._occupants = occupants
+        self._clicks = clicks
+        self._per_click_payments = per_click_payments
+        self._slot_payments = slot_payments
+        # round # -> RoundHistory, built once per round
+        self._rounds = {}
 
-        self.last_round = lambda : max(bids.keys())
         self.n_agents = n_agents
-        self.num_rounds = lambda : max(bids.keys()) + 1
         ## How much the agents spend.
         self.agents_spent = [0 for i in range(n_agents)]
+        ## Running totals for Stats, if the simulator kept them
+        self.totals = None
+        ## The simulation's clicks.ClickModel, if any
+        self.click_model = None
+
+    def finish_round(self, t):
+        """Freeze round t.  Called by the simulator once the round is over."""
+        r = History.RoundHistory(
+            self._bids[t], self._occupants[t],
+            self._clicks[t], self._per_click_payments[t],
+            self._slot_payments[t])
+        self._rounds[t] = r
+        return r
+
+    def round(self, t):
+        r = self._rounds.get(t)
+        if r is None:
+            r = self.finish_round(t)
+        return r
+
+    def num_rounds(self):
+        return len(self._bids)
+
+    def last_round(self):
+        return self.num_rounds() - 1
 
     def set_agent_spent(self, aid, spent):
         self.agents_spent[aid] = spent
 
 
+class SpendLedger:
+    """
+    Running per-agent spend totals, updated once per round by the simulator.
+    Keeps the totals from before the most recent round as well, since that is
+    what History.agents_spent shows while the next round is being bid.
+    """
+    def __init__(self, n_agents, budget):
+        self.budget = budget
+        self.totals = [0 for i in range(n_agents)]
+        self.previous = list(self.totals)
+
+    def record(self, occupants, slot_payments):
+        """Charge each slot's occupant for one round's slot payments."""
+        self.previous = list(self.totals)
+        for (a_id, payment) in zip(occupants, slot_payments):
+            if a_id is not None:
+                self.totals[a_id] += payment
+
+    def spent(self, aid):
+        """Total spent by aid in all recorded rounds."""
+        return self.totals[aid]
+
+    def remaining(self, aid):
+        return self.budget - self.totals[aid]
+
+    def has_money(self, aid):
+        return self.totals[aid] < self.budget
+
+
+def pack(xs):
+    """
+    xs as an array of ints or of floats, which takes a fraction of the
+    memory of a list, or as a tuple if it mixes types (so every number
+    comes back as it went in).
+    """
+    types = set(map(type, xs))
+    if types <= _INT:
+        typecode = 'l'
+    elif types == _FLOAT:
+        typecode = 'd'
+    else:
+        return tuple(xs)
+    try:
+        return array(typecode, xs)
+    except OverflowError:
+        return tuple(xs)
+
+_INT = set([int])
+_FLOAT = set([float])
+
+
+# How many RoundHistory records recent_round() keeps around
+RECENT_ROUNDS = 4
+
+def recent_round(history, t, unpack):
+    """
+    The RoundHistory of round t, for histories that store finished rounds
+    some other way and only keep records for the last few rounds, which is
+    all agents look at.  Older rounds are rebuilt with unpack(t).
+    """
+    r = history._rounds.get(t)
+    if r is None:
+        r = unpack(t)
+        history._rounds[t] = r
+        if len(history._rounds) > RECENT_ROUNDS:
+            del history._rounds[min(history._rounds)]
+    return r
+
+
+class CompactHistory(History):
+    """
+    History that packs each round into arrays when it finishes, instead of
+    keeping lists of tuples.  Older rounds are unpacked again when asked
+    for.
+    """
+
+    def __init__(self, bids, occupants, clicks,
+                 per_click_payments, slot_payments, n_agents=3):
+        History.__init__(self, bids, occupants, clicks,
+                         per_click_payments, slot_payments, n_agents)
+        # Round t is _packed[t]: (ids, bid amounts, occupants, clicks,
+        # per_click_payments, slot_payments), where ids is None if the bids
+        # are in id order
+        self._packed = []
+
+    def finish_round(self, t):
+        """Pack round t.  Rounds must finish in order."""
+        bids = self._bids.pop(t)
+        ids = [a_id for (a_id, _) in bids]
+        if ids == range(len(ids)):
+            ids = None
+        else:
+            ids = pack(ids)
+        self._packed.append((ids, pack([b for (_, b) in bids]),
+                             pack(self._occupants.pop(t)),
+                             pack(self._clicks.pop(t)),
+                             pack(self._per_click_payments.pop(t)),
+                             pack(self._slot_payments.pop(t))))
+        return self.round(t)
+
+    def round(self, t):
+        return recent_round(self, t, self.unpack_round)
 
+    def unpack_round(self, t):
+        (ids, amounts, occupants, clicks, per_click_payments,
+         slot_payments) = self._packed[t]
+        if ids is None:
+            ids = xrange(len(amounts))
+        return History.RoundHistory(zip(ids, amounts), occupants, clicks,
+                                    per_click_payments, slot_payments)
 
+    def num_rounds(self):
+        return len(self._packed)
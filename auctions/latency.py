@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+# Bid latency accounting (--bid-latency, --bid-time-budget).
+#
+# The simulator times every initial_bid() and bid() call.  Times go into
+# histograms with logarithmic buckets, so memory doesn't grow with the
+# number of calls, and the histograms of worker processes can be added up.
+
+import math
+
+# Buckets are powers of STEP (about 19% wide), starting at SMALLEST seconds
+SMALLEST = 1e-7
+STEP = 2 ** 0.25
+_LOG_STEP = math.log(STEP)
+
+
+def fmt_seconds(seconds):
+    """Format a time in seconds as ms or us, or n/a for None."""
+    if seconds is None:
+        return "n/a"
+    if seconds >= 1e-3:
+        return "%.2fms" % (1e3 * seconds)
+    return "%.1fus" % (1e6 * seconds)
+
+
+class LatencyHistogram:
+    def __init__(self):
+        self.buckets = {}  # bucket -> count
+        self.count = 0
+        self.max = 0.0
+
+    def add(self, seconds):
+        if seconds <= SMALLEST:
+            b = 0
+        else:
+            b = int(math.ceil(math.log(seconds / SMALLEST) / _LOG_STEP))
+        self.buckets[b] = self.buckets.get(b, 0) + 1
+        self.count += 1
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other):
+        for (b, c) in other.buckets.items():
+            self.buckets[b] = self.buckets.get(b, 0) + c
+        self.count += other.count
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q):
+        """
+        Upper bound of the q'th quantile (0 < q <= 1), to within a bucket,
+        or None if there are no times.
+        """
+        if self.count == 0:
+            return None
+        rank = max(1, int(math.ceil(q * self.count)))
+        seen = 0
+        for b in sorted(self.buckets):
+            seen += self.buckets[b]
+            if seen >= rank:
+                return min(SMALLEST * STEP ** b, self.max)
+        return self.max
+
+    def summary(self):
+        return "p50 %s, p99 %s, max %s (%d calls)" % (
+            fmt_seconds(self.percentile(0.5)),
+            fmt_seconds(self.percentile(0.99)),
+            fmt_seconds(self.percentile(1.0)), self.count)
+
+
+class BidLatency:
+    """
+    initial_bid() and bid() latency histograms for each agent, over every
+    simulation run in this process.  With a budget (seconds), also counts
+    calls that took longer; with reuse, sim() then stops calling the agent
+    for the rest of that simulation, and repeats its previous bid instead.
+    """
+    def __init__(self, n_agents, budget=None, reuse=False):
+        self.budget = budget
+        self.reuse = reuse
+        self.initial = [LatencyHistogram() for i in range(n_agents)]
+        self.bids = [LatencyHistogram() for i in range(n_agents)]
+        self.over_budget = [0] * n_agents
+        # Number of simulations in which each agent was benched
+        self.benched = [0] * n_agents
+
+    def record(self, a_id, seconds, initial):
+        """Record one call.  Returns True if it was over the budget."""
+        if initial:
+            self.initial[a_id].add(seconds)
+        else:
+            self.bids[a_id].add(seconds)
+        if self.budget is not None and seconds > self.budget:
+            self.over_budget[a_id] += 1
+            return True
+        return False
+
+    def take(self):
+        """Return what was recorded so far, and start over.  For worker
+        processes to send their latencies back."""
+        n = len(self.bids)
+        taken = (self.initial, self.bids, self.over_budget, self.benched)
+        self.initial = [LatencyHistogram() for i in range(n)]
+        self.bids = [LatencyHistogram() for i in range(n)]
+        self.over_budget = [0] * n
+        self.benched = [0] * n
+        return taken
+
+    def merge(self, taken):
+        """Add what take() returned."""
+        (initial, bids, over_budget, benched) = taken
+        for a_id in range(len(self.bids)):
+            self.initial[a_id].merge(initial[a_id])
+            self.bids[a_id].merge(bids[a_id])
+            self.over_budget[a_id] += over_budget[a_id]
+            self.benched[a_id] += benched[a_id]
+
+    def report(self, a_id):
+        """Lines describing agent a_id's latencies."""
+        lines = ["initial_bid latency %s" % self.initial[a_id].summary(),
+                 "bid latency %s" % self.bids[a_id].summary()]
+        if self.budget is not None:
+            line = "%d calls over the %s budget" % (
+                self.over_budget[a_id], fmt_seconds(self.budget))
+            if self.reuse:
+                line += ", benched in %d simulations" % self.benched[a_id]
+            lines.append(line)
+        return lines
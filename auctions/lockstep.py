@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+# Lockstep simulation of many value permutations at once.
+#
+# When every agent's bid depends only on its own value (and the round and
+# reserve), the permutations of a value draw only differ in who bids what.
+# Instead of one sim() per permutation, this advances all of them together:
+# bids, allocations and payments are (permutations x agents) arrays, and each
+# round is one batched mechanism call.
+#
+# An agent class opts in by setting vectorizable = True and providing
+#   batch_initial_bid(values, reserve)
+#   batch_bid(t, values, reserve)
+# which take an array of values (one per permutation) and return the bids.
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from clicks import click_model_for
+from gsp import GSP
+from vcg import VCG
+
+
+def can_lockstep(agent_classes):
+    """True if numpy is available and every class declares itself
+    vectorizable."""
+    return np is not None and all(getattr(c, 'vectorizable', False)
+                                  for c in agent_classes)
+
+
+def lockstep_perms(options, perms, rng):
+    """
+    Simulate every value assignment in perms (a list of per-agent value
+    lists) in lockstep.  rng is the numpy.random.RandomState used to break
+    ties.  Returns one (utilities, spent, revenue) triple per permutation,
+    like auction.run_perm.
+    """
+    values = np.array(perms)
+    (num_perms, n) = values.shape
+    num_slots = max(1, n-1)
+    reserve = options.reserve
+    click_model = click_model_for(options, num_slots)
+
+    # Columns of each agent class
+    columns = {}
+    for (a_id, class_name) in enumerate(options.agent_class_names):
+        columns.setdefault(class_name, []).append(a_id)
+
+    if options.mechanism.lower() not in ('gsp', 'vcg', 'switch'):
+        raise ValueError("mechanism must be one of 'gsp', 'vcg', or 'switch'")
+    mechanism = VCG if options.mechanism.lower() == 'vcg' else GSP
+
+    utility = np.zeros((num_perms, n), dtype=values.dtype)
+    spent = np.zeros((num_perms, n), dtype=values.dtype)
+    revenue = np.zeros(num_perms, dtype=values.dtype)
+
+    for t in range(options.num_rounds):
+        clicks = np.array(click_model.clicks(t))
+        if t == options.num_rounds / 2 and options.mechanism == 'switch':
+            mechanism = VCG
+
+        class_bids = []
+        for (class_name, cols) in columns.items():
+            agent_class = options.agent_classes[class_name]
+            if t == 0:
+                b = agent_class.batch_initial_bid(values[:, cols], reserve)
+            else:
+                b = agent_class.batch_bid(t, values[:, cols], reserve)
+            class_bids.append((cols, np.asarray(b)))
+        bids = np.empty((num_perms, n),
+                        np.result_type(*[b for (_, b) in class_bids]))
+        for (cols, b) in class_bids:
+            bids[:, cols] = b
+        if t > 0:
+            # Bids from agents with no money get reduced to zero
+            bids = np.where(spent < options.budget, bids, 0)
+
+        (allocation, per_click_payments) = mechanism.compute_batch(
+            clicks, reserve, bids, rng)
+
+        # (permutation, slot) of every filled slot, and who holds it.  An
+        # agent holds at most one slot per round, so no (row, agent) repeats.
+        (p, s) = np.nonzero(allocation >= 0)
+        occupants = allocation[p, s]
+        payments = per_click_payments[p, s]
+
+        round_utility = np.zeros((num_perms, n),
+                                 np.result_type(values, payments))
+        round_utility[p, occupants] = clicks[s] * (values[p, occupants] -
+                                                   payments)
+        round_spent = np.zeros((num_perms, n), payments.dtype)
+        round_spent[p, occupants] = clicks[s] * payments
+
+        utility = utility + round_utility
+        spent = spent + round_spent
+        revenue = revenue + round_spent.sum(axis=1)
+
+    return zip(utility.tolist(), spent.tolist(), revenue.tolist())
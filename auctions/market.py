@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+
+from gsp import GSP
+
+class MarketContext:
+    """
+    The market picture after a round, computed once by the simulator and
+    shared by every agent: the bids at or above the reserve sorted from
+    highest to lowest, the clicks, and each agent's slot prices with its own
+    bid left out.
+    """
+    def __init__(self, bids, clicks, reserve):
+        """bids is a list of (id, bid) tuples, clicks the clicks per slot."""
+        self.clicks = tuple(clicks)
+        self.reserve = reserve
+        # Sorted the same way as GSP.sorted_bids
+        valid = [(a_id, b) for (a_id, b) in bids if b >= reserve]
+        valid.sort(key=lambda (a_id, b): b)
+        valid.reverse()
+        self.sorted_bids = tuple(b for (_, b) in valid)
+        # id -> index in sorted_bids, for ids with a bid above the reserve
+        self._positions = dict((a_id, i) for (i, (a_id, _)) in
+                               enumerate(valid))
+
+    def bid_range(self, a_id, slot):
+        """
+        GSP.bid_range_for_slot for slot, with the bid of a_id left out, in
+        O(1).
+        """
+        bid_amounts = self.sorted_bids
+        p = self._positions.get(a_id)
+        if p is None:
+            return GSP.slot_range(slot, bid_amounts, self.reserve)
+
+        n = len(bid_amounts) - 1
+        def other(i):
+            """The i'th highest bid of everyone but a_id"""
+            return bid_amounts[i + 1] if i >= p else bid_amounts[i]
+
+        if slot >= n:
+            # More than reserve, less than smallest bid
+            if n > 0:
+                max_bid = other(n - 1)
+            else:
+                max_bid = self.reserve if slot > 0 else None
+            return (self.reserve, max_bid)
+
+        min_bid = other(slot)
+        max_bid = other(slot - 1) if slot > 0 else None
+        return (min_bid, max_bid)
+
+    def bid_ranges(self, a_id):
+        """
+        The (min_bid, max_bid) of every slot for a_id, like GSP.bid_ranges
+        over the other agents' bids.
+        """
+        return [self.bid_range(a_id, slot) for slot in range(len(self.clicks))]
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+# Opt-in timers for the phases of a simulation (--profile).
+#
+# The simulator marks the start of a phase and laps at its end; laps add up
+# per phase name.  When profiling is off, sim() gets a NullProfiler whose
+# methods do nothing, so the cost is one method call per phase.
+
+import json
+from timeit import default_timer as timer
+
+
+class NullProfiler:
+    enabled = False
+
+    def mark(self):
+        pass
+
+    def lap(self, phase):
+        pass
+
+    def add(self, phase, seconds, calls=1):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class Profiler:
+    """Total seconds and number of laps per phase."""
+    enabled = True
+
+    def __init__(self):
+        self.seconds = {}
+        self.calls = {}
+        self.last = timer()
+
+    def mark(self):
+        """Start timing a phase."""
+        self.last = timer()
+
+    def lap(self, phase):
+        """Charge the time since the last mark or lap to phase."""
+        now = timer()
+        self.add(phase, now - self.last)
+        self.last = now
+
+    def add(self, phase, seconds, calls=1):
+        self.seconds[phase] = self.seconds.get(phase, 0.0) + seconds
+        self.calls[phase] = self.calls.get(phase, 0) + calls
+
+    def take(self):
+        """Return (seconds, calls) so far, and start over.  For worker
+        processes to send their times back."""
+        times = (self.seconds, self.calls)
+        self.seconds = {}
+        self.calls = {}
+        return times
+
+    def merge(self, times):
+        """Add (seconds, calls) from take()."""
+        (seconds, calls) = times
+        for phase in seconds:
+            self.add(phase, seconds[phase], calls[phase])
+
+    def summary(self, wall_time):
+        """
+        One dict per phase, sorted by name, with the total and per-call
+        time and the fraction of wall_time it took.  Phases nest (the
+        sim/ phases are part of main/permutations), and with worker
+        processes their times add up over the workers, so fractions can add
+        up to more than 1.
+        """
+        return [{'phase': phase,
+                 'seconds': self.seconds[phase],
+                 'calls': self.calls[phase],
+                 'per_call': self.seconds[phase] / self.calls[phase],
+                 'fraction': (self.seconds[phase] / wall_time
+                              if wall_time > 0 else None)}
+                for phase in sorted(self.seconds)]
+
+    def report(self, wall_time):
+        """The summary as lines of a table."""
+        lines = ["%-32s %10s %10s %12s %7s" % (
+            "phase", "seconds", "calls", "us/call", "%")]
+        for row in self.summary(wall_time):
+            if row['fraction'] is None:
+                percent = "n/a"
+            else:
+                percent = "%.1f" % (100 * row['fraction'])
+            lines.append("%-32s %10.3f %10d %12.2f %7s" % (
+                row['phase'], row['seconds'], row['calls'],
+                1e6 * row['per_call'], percent))
+        lines.append("%-32s %10.3f" % ("wall time", wall_time))
+        return lines
+
+    def write_json(self, path, wall_time):
+        with open(path, 'w') as f:
+            json.dump({'wall_time': wall_time,
+                       'phases': self.summary(wall_time)}, f, indent=1)
@@ -0,0 +1,378 @@
+#!/usr/bin/env python
+
+# Remote agents: bidders that run as separate services.
+#
+# Usage:  python remote.py [--port PORT | --unix PATH] ClassName
+#
+# runs a stand-in server that bids with a local agent class.  The simulator
+# names a remote agent remote@HOST:PORT or remote@/path/to/socket, and
+# talks to it over one connection per agent, one JSON object per line.
+# Requests carry a seq number, which the reply repeats:
+#
+#   {"seq": 1, "method": "initial_bid", "id": 0, "value": 80,
+#    "budget": 500000, "n_agents": 3, "reserve": 0,
+#    "traffic": [...], "clicks": [[...], ...]}
+#       starts a simulation: the agent's id, value and budget, and the
+#       clicks of every slot in every round.
+#   {"seq": 2, "method": "bid", "t": 1, "reserve": 0,
+#    "round": {"bids": [[0, 80], ...], "occupants": [...], ...},
+#    "agents_spent": [...]}
+#       round is everything about round t - 1 that History has.
+#
+#   {"seq": 1, "bid": 80}  or  {"seq": 1, "error": "..."}
+#
+# Every round, sim() sends the requests of all its remote agents at once
+# and waits for the replies until the round's deadline, so a round takes
+# as long as the slowest bidder, not the sum of them.  An agent that misses
+# the deadline, or replies with an error, keeps its previous bid (0 in the
+# first round); late replies are dropped.
+
+from multiprocessing.util import Finalize
+from optparse import OptionParser
+import SocketServer
+import errno
+import inspect
+import json
+import logging
+import os
+import select
+import socket
+import sys
+
+from agent import Agent
+from clicks import ClickModel
+from history import CompactHistory, History
+from market import MarketContext
+from profiling import timer
+
+PREFIX = 'remote@'
+
+# Seconds to wait for the replies of a round, by default
+DEADLINE = 1.0
+
+
+def is_remote(class_name):
+    return class_name.startswith(PREFIX)
+
+
+def parse_address(address):
+    """A socket path (anything with a /) or HOST:PORT, as (family, address)."""
+    if '/' in address:
+        return (socket.AF_UNIX, address)
+    (host, port) = address.rsplit(':', 1)
+    return (socket.AF_INET, (host, int(port)))
+
+
+class Connection:
+    """A line-oriented JSON connection to a remote agent."""
+    def __init__(self, address):
+        self.address = address
+        (family, addr) = parse_address(address)
+        self.sock = socket.socket(family, socket.SOCK_STREAM)
+        self.sock.connect(addr)
+        if family == socket.AF_INET:
+            self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.buffer = ''
+        self.seq = 0
+
+    def send(self, message):
+        """Send message with the next seq number, which is returned."""
+        self.seq += 1
+        message['seq'] = self.seq
+        self.sock.sendall(json.dumps(message) + '\n')
+        return self.seq
+
+    def receive(self):
+        """The replies that have come in.  Call when the socket is
+        readable."""
+        data = self.sock.recv(65536)
+        if not data:
+            raise RuntimeError("%s%s closed the connection" % (
+                PREFIX, self.address))
+        self.buffer += data
+        lines = self.buffer.split('\n')
+        self.buffer = lines.pop()
+        return [json.loads(line) for line in lines if line]
+
+    def close(self):
+        self.sock.close()
+
+
+# (address, agent id) -> Connection, opened once per process, and the
+# process they belong to
+_connections = {}
+_connections_pid = None
+
+def connection(address, a_id):
+    global _connections, _connections_pid
+    if _connections_pid != os.getpid():
+        # A new (or forked) process: open its own connections, and close
+        # them when it exits, worker processes included
+        _connections = {}
+        _connections_pid = os.getpid()
+        Finalize(None, close_connections, exitpriority=10)
+    conn = _connections.get((address, a_id))
+    if conn is None:
+        conn = Connection(address)
+        _connections[(address, a_id)] = conn
+    return conn
+
+def close_connections():
+    """Close this process's connections to remote agents."""
+    if _connections_pid == os.getpid():
+        for conn in _connections.values():
+            conn.close()
+        _connections.clear()
+
+
+class RemoteAgent(Agent):
+    """
+    Stands in for an agent on the other end of a connection.  sim() calls
+    collect_bids() at the start of every round, and then initial_bid() and
+    bid() return what came back.
+    """
+    __slots__ = ('address', 'conn', 'next_bid')
+
+    def __init__(self, id, value, budget, address):
+        self.address = address
+        Agent.__init__(self, id, value, budget)
+
+    def reset(self, value, budget):
+        Agent.reset(self, value, budget)
+        self.conn = connection(self.address, self.id)
+        self.next_bid = 0
+
+    def initial_bid(self, reserve):
+        return self.next_bid
+
+    def bid(self, t, history, reserve):
+        return self.next_bid
+
+    def __repr__(self):
+        return "RemoteAgent(id=%d, value=%d, address=%s)" % (
+            self.id, self.value, self.address)
+
+
+class RemoteClass:
+    """
+    The agent class of remote@ADDRESS: calling it with an id, value and
+    budget makes a RemoteAgent.  Unlike a class made on the fly, it can be
+    sent to worker processes.
+    """
+    def __init__(self, address):
+        self.address = address
+
+    def __call__(self, id, value, budget):
+        return RemoteAgent(id, value, budget, self.address)
+
+
+def remote_class(class_name):
+    """The agent class of remote@ADDRESS."""
+    return RemoteClass(class_name[len(PREFIX):])
+
+
+def round_message(r):
+    """A History.RoundHistory as a dict for JSON."""
+    return dict(zip(r._fields, r))
+
+
+def collect_bids(agents, t, history, reserve, deadline=DEADLINE):
+    """
+    Ask every remote agent for its round t bid at once, and wait up to
+    deadline seconds for them to reply.  Sets each agent's next_bid.
+    Agents that reply with an error keep their previous bid, like agents
+    that miss the deadline.  Returns the ids of the agents that did either.
+    """
+    if t == 0:
+        model = history.click_model
+        setup = {'method': 'initial_bid', 'n_agents': history.n_agents,
+                 'reserve': reserve,
+                 'traffic': [model.traffic(s) for s in range(model.num_rounds)],
+                 'clicks': [list(row) for row in model.rows]}
+    else:
+        setup = {'method': 'bid', 't': t, 'reserve': reserve,
+                 'round': round_message(history.round(t - 1)),
+                 'agents_spent': list(history.agents_spent)}
+
+    waiting = {}  # socket -> (agent, seq)
+    failed = []
+    for a in agents:
+        message = dict(setup)
+        if t == 0:
+            message.update(id=a.id, value=a.value, budget=a.budget)
+        waiting[a.conn.sock] = (a, a.conn.send(message))
+
+    end = timer() + deadline
+    while waiting:
+        remaining = end - timer()
+        if remaining <= 0:
+            break
+        try:
+            (readable, _, _) = select.select(list(waiting), [], [], remaining)
+        except select.error as e:
+            if e.args[0] == errno.EINTR:
+                continue
+            raise
+        for sock in readable:
+            (a, seq) = waiting[sock]
+            for reply in a.conn.receive():
+                # Late replies to earlier requests are dropped
+                if reply.get('seq') != seq:
+                    continue
+                if 'error' in reply:
+                    logging.warning("Round %d: %s%s (agent %d) failed: %s" % (
+                        t, PREFIX, a.address, a.id, reply['error']))
+                    failed.append(a.id)
+                else:
+                    a.next_bid = reply['bid']
+                del waiting[sock]
+
+    missed = sorted(a.id for (a, _) in waiting.values())
+    if missed:
+        logging.debug("Round %d: agents %s missed the deadline" % (t, missed))
+    return sorted(missed + failed)
+
+
+class BidderSession:
+    """
+    The server side of one connection: a local agent of agent_class, and
+    the History it sees, rebuilt from the requests.
+    """
+    def __init__(self, agent_class):
+        self.agent_class = agent_class
+        self.agent = None
+
+    def initial_bid(self, message):
+        (a_id, value, budget) = (message['id'], message['value'],
+                                 message['budget'])
+        if self.agent is not None and self.agent.id == a_id:
+            self.agent.reset(value, budget)
+        else:
+            self.agent = self.agent_class(a_id, value, budget)
+            self.with_market = 'market' in inspect.getargspec(
+                self.agent.bid).args
+        self.rounds = dict((k, {}) for k in History.RoundHistory._fields)
+        # Rounds are packed as they come in, so long simulations don't
+        # grow the session
+        self.history = CompactHistory(self.rounds['bids'],
+                                      self.rounds['occupants'],
+                                      self.rounds['clicks'],
+                                      self.rounds['per_click_payments'],
+                                      self.rounds['slot_payments'],
+                                      message['n_agents'])
+        self.history.click_model = ClickModel.from_rows(message['traffic'],
+                                                        message['clicks'])
+        return self.agent.initial_bid(message['reserve'])
+
+    def bid(self, message):
+        t = message['t']
+        for (k, v) in message['round'].items():
+            self.rounds[k][t - 1] = v
+        r = self.history.finish_round(t - 1)
+        self.history.agents_spent = message['agents_spent']
+        if self.with_market:
+            market = MarketContext(r.bids, r.clicks, message['reserve'])
+            return self.agent.bid(t, self.history, message['reserve'],
+                                  market)
+        return self.agent.bid(t, self.history, message['reserve'])
+
+    def handle(self, message):
+        """The reply to message."""
+        try:
+            if message['method'] == 'initial_bid':
+                b = self.initial_bid(message)
+            elif message['method'] == 'bid':
+                b = self.bid(message)
+            else:
+                raise ValueError("unknown method %s" % message['method'])
+        except Exception as e:
+            logging.exception("Request %s failed" % message.get('seq'))
+            return {'seq': message.get('seq'), 'error': str(e)}
+        return {'seq': message['seq'], 'bid': b}
+
+
+class _SessionHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        session = BidderSession(self.server.agent_class)
+        try:
+            for line in iter(self.rfile.readline, ''):
+                reply = session.handle(json.loads(line))
+                self.wfile.write(json.dumps(reply) + '\n')
+                self.wfile.flush()
+        except socket.error as e:
+            # The simulator went away, e.g. with requests still queued
+            logging.debug("Connection closed: %s" % e)
+
+
+class _TCPServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def server_bind(self):
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        SocketServer.TCPServer.server_bind(self)
+
+
+class _UnixServer(SocketServer.ThreadingMixIn,
+                  SocketServer.UnixStreamServer):
+    daemon_threads = True
+
+
+def make_server(agent_class, address):
+    """
+    A stand-in server for remote agents that bids with agent_class, one
+    agent per connection, each in its own thread.  Call serve_forever() on
+    it.  With a TCP address, port 0 picks a free port; the server's
+    address attribute is what to put after remote@.
+    """
+    (family, addr) = parse_address(address)
+    if family == socket.AF_UNIX:
+        server = _UnixServer(addr, _SessionHandler)
+        server.address = addr
+    else:
+        server = _TCPServer(addr, _SessionHandler)
+        server.address = "%s:%d" % server.server_address
+    server.agent_class = agent_class
+    return server
+
+
+def main(args):
+    usage_msg = "Usage:  %prog [options] ClassName"
+    parser = OptionParser(usage=usage_msg)
+
+    parser.add_option("--host",
+                      dest="host", default="localhost",
+                      help="Host to listen on")
+
+    parser.add_option("--port",
+                      dest="port", default=0, type="int",
+                      help="Port to listen on (default: any free one)")
+
+    parser.add_option("--unix",
+                      dest="unix", default=None,
+                      help="Listen on this Unix socket instead")
+
+    (options, names) = parser.parse_args(args[1:])
+    if len(names) != 1:
+        parser.print_help()
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+    from auction import load_modules
+    agent_class = load_modules(names)[names[0]]
+    if options.unix is not None:
+        address = options.unix
+    else:
+        address = "%s:%d" % (options.host, options.port)
+    server = make_server(agent_class, address)
+    logging.info("Bidding with %s at %s%s" % (names[0], PREFIX,
+                                             server.address))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    server.server_close()
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+# Counterfactual replay of recorded bids (see traces.py).
+#
+# Usage:  python replay.py [options] TRACE_DIR
+#
+# Answers "what would revenue have been under VCG, or with reserve r?" on
+# the bid streams of a trace, without running any agent: the recorded bids
+# of every round go through the batched mechanisms for each mechanism and
+# reserve in the grid, a shard at a time.  This is open-loop: agents don't
+# react to the new outcomes, and bids that were zeroed because an agent ran
+# out of budget stay zero.
+
+from optparse import OptionParser
+import json
+import math
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from aggregate import Z_95
+from gsp import GSP
+from traces import Trace
+from vcg import VCG
+
+MECHANISMS = {'gsp': GSP, 'vcg': VCG}
+
+
+def as_cents(bids):
+    """
+    Traces store bids as floats.  If they're all whole numbers, turn them
+    back into integers, so VCG payments are rounded like in sim().
+    """
+    if np.all(bids == np.floor(bids)):
+        return bids.astype(np.int64)
+    return bids
+
+
+def replay_rounds(mechanism, reserve, bids, clicks, values, rng):
+    """
+    Run mechanism with reserve on every round at once.  bids and values are
+    (rounds x agents) arrays, clicks (rounds x slots).  Returns the revenue
+    of each round, and each agent's utility and spend in each round.
+    """
+    (allocation, per_click_payments) = mechanism.compute_batch(
+        clicks, reserve, bids, rng)
+    (rounds, n) = bids.shape
+    (p, s) = np.nonzero(allocation >= 0)
+    occupants = allocation[p, s]
+    payments = per_click_payments[p, s]
+
+    # An agent holds at most one slot per round, so no (round, agent)
+    # repeats
+    utility = np.zeros((rounds, n), np.result_type(values, payments))
+    utility[p, occupants] = clicks[p, s] * (values[p, occupants] - payments)
+    spend = np.zeros((rounds, n), payments.dtype)
+    spend[p, occupants] = clicks[p, s] * payments
+    return (spend.sum(axis=1), utility, spend)
+
+
+def summarize(xs):
+    """Mean, standard error and 95% confidence interval of the rows of xs
+    (one row per simulation), like aggregate.RunningMoments.summary."""
+    xs = np.asarray(xs, float)
+    n = len(xs)
+    mean = xs.mean(axis=0)
+    if n < 2:
+        return {'n': n, 'mean': mean.tolist(), 'stderr': None, 'ci95': None}
+    stderr = xs.std(axis=0, ddof=1) / math.sqrt(n)
+    return {'n': n,
+            'mean': mean.tolist(),
+            'stderr': stderr.tolist(),
+            'ci95': [(mean - Z_95 * stderr).tolist(),
+                     (mean + Z_95 * stderr).tolist()]}
+
+
+def replay(trace, mechanisms, reserves, rng=None):
+    """
+    Replay every simulation in trace under each mechanism name (in
+    MECHANISMS) and reserve.  Returns one dict per (mechanism, reserve),
+    with summaries over simulations of the total revenue and of each
+    agent's total utility and spend.
+    """
+    if np is None:
+        raise ImportError("replay requires numpy")
+    if rng is None:
+        rng = np.random.RandomState(0)
+    grid = [(m, r) for m in mechanisms for r in reserves]
+    per_sim = dict((key, ([], [], [])) for key in grid)
+
+    for shard in trace.shards():
+        entries = [e for e in trace.simulations if e['shard'] == shard]
+        first = entries[0]['start']
+        end = entries[-1]['start'] + entries[-1]['num_rounds']
+        bids = as_cents(np.asarray(trace.column(shard, 'bids')[first:end]))
+        clicks = np.asarray(trace.column(shard, 'clicks')[first:end])
+        values = np.repeat([e['values'] for e in entries],
+                           [e['num_rounds'] for e in entries], axis=0)
+        # First row of each simulation, for adding up its rounds
+        starts = [e['start'] - first for e in entries]
+
+        for (name, reserve) in grid:
+            (revenue, utility, spend) = replay_rounds(
+                MECHANISMS[name], reserve, bids, clicks, values, rng)
+            (revenues, utilities, spends) = per_sim[(name, reserve)]
+            revenues.extend(np.add.reduceat(revenue, starts).tolist())
+            utilities.extend(np.add.reduceat(utility, starts, axis=0))
+            spends.extend(np.add.reduceat(spend, starts, axis=0))
+
+    results = []
+    for (name, reserve) in grid:
+        (revenues, utilities, spends) = per_sim[(name, reserve)]
+        results.append({'mechanism': name,
+                        'reserve': reserve,
+                        'revenue': summarize(revenues),
+                        'utility': summarize(utilities),
+                        'spend': summarize(spends)})
+    return results
+
+
+def main(args):
+    usage_msg = "Usage:  %prog [options] TRACE_DIR"
+    parser = OptionParser(usage=usage_msg)
+
+    parser.add_option("--mechs",
+                      dest="mechanisms", default="gsp,vcg",
+                      help="Mechanisms to replay, separated by commas: %s" % " or ".join(sorted(MECHANISMS)))
+
+    parser.add_option("--reserves",
+                      dest="reserves", default="0",
+                      help="Reserve prices to replay, in cents, separated by commas")
+
+    parser.add_option("--json",
+                      dest="json", default=None,
+                      help="Write the results to this file as JSON")
+
+    parser.add_option("--seed",
+                      dest="seed", default=0, type="int",
+                      help="seed for breaking ties")
+
+    (options, dirs) = parser.parse_args(args[1:])
+    if len(dirs) != 1:
+        parser.print_help()
+        sys.exit(1)
+    mechanisms = options.mechanisms.split(',')
+    for name in mechanisms:
+        if name not in MECHANISMS:
+            print "Error: unknown mechanism %s\n" % name
+            parser.print_help()
+            sys.exit(1)
+    reserves = [int(r) for r in options.reserves.split(',')]
+
+    trace = Trace(dirs[0])
+    results = replay(trace, mechanisms, reserves,
+                     np.random.RandomState(options.seed))
+
+    print "Replayed %d simulations (%d rounds) of %s" % (
+        len(trace.simulations), trace.num_rounds(), ", ".join(trace.agents))
+    print "%-5s %8s %14s %10s %14s" % ("mech", "reserve", "revenue",
+                                       "stderr", "total utility")
+    for r in results:
+        stderr = r['revenue']['stderr']
+        print "%-5s %8d %14.2f %10s %14.2f" % (
+            r['mechanism'], r['reserve'], 0.01 * r['revenue']['mean'],
+            "n/a" if stderr is None else "%.2f" % (0.01 * stderr),
+            0.01 * sum(r['utility']['mean']))
+    if options.json is not None:
+        with open(options.json, 'w') as f:
+            json.dump(results, f, indent=1)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+
+# Search for the revenue-maximizing reserve price.
+#
+# Usage:  python reserve.py [options] PeerClass1[,cnt] PeerClass2[,cnt2] ...
+#
+# Takes the options of auction.py, except the ones that change which
+# simulations a sweep runs (UNSUPPORTED).  The value draws, permutations and
+# seeds of the sweep are drawn once and reused for every candidate reserve
+# (common random numbers), so differences between reserves aren't drowned
+# out by differences between draws.  The grid of --reserves is evaluated
+# first, in one batch of tasks for the worker pool, and then the search
+# narrows in on the best reserve by evaluating the midpoints on either side
+# of it, --refine-steps times.
+
+import itertools
+import json
+import logging
+import math
+import multiprocessing
+import random
+import sys
+
+from aggregate import RunningMoments
+from auction import (_init_tasks, configure, configure_logging, dollar_range,
+                     dollars, get_utils, iteration_tasks, make_parser,
+                     perm_results, report_profile)
+from profiling import NULL_PROFILER, timer
+
+# Number of grid points when there is no --reserves
+GRID_POINTS = 9
+
+# (dest, option) of the auction.py options that reserve.py doesn't take:
+# every candidate reserve is simulated on the same fixed draws, one by one
+UNSUPPORTED = [('dedup', '--dedup'),
+               ('lockstep', '--lockstep'),
+               ('tolerance', '--tolerance'),
+               ('max_iters', '--max-iters'),
+               ('time_budget', '--time-budget'),
+               ('jsonl', '--jsonl'),
+               ('trace_dir', '--trace')]
+
+
+def parse_reserves(spec, max_val):
+    """
+    Candidate reserves, in cents: either separated by commas, or
+    LOW:HIGH:STEP (HIGH included).  With no spec, GRID_POINTS evenly spaced
+    reserves from 0 to max_val.
+    """
+    if spec is None:
+        return sorted(set(int(round(max_val * i / float(GRID_POINTS - 1)))
+                          for i in range(GRID_POINTS)))
+    if ':' in spec:
+        (low, high, step) = [int(x) for x in spec.split(':')]
+        if step <= 0:
+            raise ValueError("the step of --reserves must be positive")
+        return range(low, high + 1, step)
+    return sorted(set(int(r) for r in spec.split(',')))
+
+
+def draw_tasks(n, options):
+    """
+    The (vals, seed) tasks of each iteration, drawn like auction.main draws
+    them: every permutation of the values, or --perms samples of them if
+    there are more permutations than that.
+    """
+    approx = math.factorial(n) > options.max_perms
+    return [iteration_tasks(get_utils(n, options), options, approx)[0]
+            for i in range(options.iters)]
+
+
+class ReserveSearch:
+    """
+    Average daily revenue at each evaluated reserve, over the same draws.
+    revenues[reserve] has one revenue per iteration, averaged over its
+    permutations.
+    """
+    def __init__(self, options, draws, pool=None):
+        self.options = options
+        self.draws = draws
+        self.pool = pool
+        self.revenues = {}
+        _init_tasks(options)
+
+    def evaluate(self, reserves):
+        """Simulate the reserves that haven't been evaluated yet, all in
+        one batch."""
+        todo = sorted(set(reserves) - set(self.revenues))
+        if not todo:
+            return
+        logging.info("Evaluating reserves %s" % todo)
+        profiler = getattr(self.options, 'profiler', None) or NULL_PROFILER
+        start = timer()
+        tasks = [(vals, seed, {'reserve': r}) for r in todo
+                 for perms in self.draws for (vals, seed) in perms]
+        results = perm_results(self.pool, self.options.workers, tasks)
+        for r in todo:
+            per_iter = []
+            for perms in self.draws:
+                total = sum(rev for (_, _, rev) in
+                            itertools.islice(results, len(perms)))
+                per_iter.append(total / float(len(perms)))
+            self.revenues[r] = per_iter
+        profiler.add("reserve/evaluate", timer() - start)
+
+    def mean(self, reserve):
+        return sum(self.revenues[reserve]) / float(len(self.draws))
+
+    def best(self):
+        """The evaluated reserve with the highest revenue (the lowest of
+        them, on ties)."""
+        return max(sorted(self.revenues), key=self.mean)
+
+    def refine(self, steps, min_step=1):
+        """
+        Bracket the best reserve between its evaluated neighbours, and
+        evaluate the midpoints on either side of it, steps times or until
+        the midpoints are less than min_step from the best reserve.
+        """
+        for i in range(steps):
+            points = sorted(self.revenues)
+            best = self.best()
+            k = points.index(best)
+            midpoints = []
+            for neighbour in points[max(0, k - 1):k + 2]:
+                m = (best + neighbour) // 2
+                if abs(m - best) >= min_step and m not in self.revenues:
+                    midpoints.append(m)
+            if not midpoints:
+                break
+            self.evaluate(midpoints)
+
+    def curve(self):
+        """
+        One dict per evaluated reserve, in order: revenue mean, standard
+        error and 95% confidence interval, and the same for the difference
+        from the best reserve.  With common random numbers the difference
+        is paired by draw, so its interval is much narrower than the
+        revenue intervals.
+        """
+        best = self.best()
+        rows = []
+        for r in sorted(self.revenues):
+            revenue = RunningMoments()
+            diff = RunningMoments()
+            for (x, y) in zip(self.revenues[r], self.revenues[best]):
+                revenue.add(x)
+                diff.add(x - y)
+            rows.append({'reserve': r,
+                         'best': r == best,
+                         'revenue': revenue.summary(),
+                         'vs_best': diff.summary()})
+        return rows
+
+
+def main(args):
+    parser = make_parser()
+
+    parser.add_option("--reserves",
+                      dest="reserves", default=None,
+                      help="Reserves to start from, in cents: separated by commas, or LOW:HIGH:STEP.  Default %d points from 0 to --max-val" % GRID_POINTS)
+
+    parser.add_option("--refine-steps",
+                      dest="refine_steps", default=4, type="int",
+                      help="Number of times to refine around the best reserve")
+
+    parser.add_option("--min-step",
+                      dest="min_step", default=1, type="int",
+                      help="Stop refining at this distance from the best reserve, in cents")
+
+    parser.add_option("--json",
+                      dest="json", default=None,
+                      help="Write the revenue curve to this file as JSON")
+
+    def usage(msg):
+        print "Error: %s\n" % msg
+        parser.print_help()
+        sys.exit()
+
+    (options, args) = parser.parse_args(args[1:])
+
+    configure_logging(options.loglevel)
+
+    if options.seed != None:
+        random.seed(options.seed)
+
+    for (dest, option) in UNSUPPORTED:
+        if getattr(options, dest) not in (None, False):
+            usage("%s isn't supported by the reserve search" % option)
+    try:
+        agents_to_run = configure(options, args)
+        reserves = parse_reserves(options.reserves, options.max_val)
+    except (ValueError, IOError) as e:
+        usage(str(e))
+
+    start_timer = timer()
+    draws = draw_tasks(len(agents_to_run), options)
+    if options.workers > 1:
+        pool = multiprocessing.Pool(options.workers, _init_tasks, (options,))
+    else:
+        pool = None
+    search = ReserveSearch(options, draws, pool)
+    search.evaluate(reserves)
+    search.refine(options.refine_steps, options.min_step)
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    curve = search.curve()
+    print "Revenue of %s over %d draws of %d permutations" % (
+        ", ".join(agents_to_run), len(draws), len(draws[0]))
+    print "%8s %10s %22s %22s" % ("reserve", "revenue", "95% CI",
+                                  "vs best, 95% CI")
+    for row in curve:
+        print "%8d %10s %22s %22s%s" % (
+            row['reserve'], dollars(row['revenue']['mean']),
+            dollar_range(row['revenue']['ci95']),
+            dollar_range(row['vs_best']['ci95']),
+            "  <- best" if row['best'] else "")
+    if options.json is not None:
+        with open(options.json, 'w') as f:
+            json.dump(curve, f, indent=1)
+
+    if options.bid_latency is not None:
+        for a in range(len(agents_to_run)):
+            logging.info("Latencies of agent %d, %s" % (a, agents_to_run[a]))
+            for line in options.bid_latency.report(a):
+                logging.info(line)
+    if options.profiler is not None:
+        report_profile(options.profiler, timer() - start_timer,
+                       options.profile_json)
+
+
+if __name__ == "__main__":
+    main(sys.argv)
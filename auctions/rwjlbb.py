@@ -2,21 +2,19 @@
 
 import sys
 
+from agent import Agent
 from gsp import GSP
 from util import argmax_index
 
-class rwjlbb:
+class rwjlbb(Agent):
     """Balanced bidding agent"""
-    def __init__(self, id, value, budget):
-        self.id = id
-        self.value = value
-        self.budget = budget
+    __slots__ = ()
 
     def initial_bid(self, reserve):
         return self.value / 2
 
 
-    def slot_info(self, t, history, reserve):
+    def slot_info(self, t, history, reserve, market=None):
         """Compute the following for each slot, assuming that everyone else
         keeps their bids constant from the previous rounds.
 
@@ -25,13 +23,21 @@ class rwjlbb:
         in the last round.  If slot_id = 0, max_bid is 2* min_bid.
         Otherwise, it's the next highest min_bid (so bidding between min_bid
         and max_bid would result in ending up in that slot)
-        """
-        prev_round = history.round(t-1)
-        other_bids = filter(lambda (a_id, b): a_id != self.id, prev_round.bids)
 
-        clicks = prev_round.clicks
+        If the simulator passes in the MarketContext for the previous round,
+        the slot prices come from there instead.
+        """
+        if market is not None:
+            clicks = market.clicks
+            ranges = market.bid_ranges(self.id)
+        else:
+            prev_round = history.round(t-1)
+            other_bids = filter(lambda (a_id, b): a_id != self.id,
+                                prev_round.bids)
+            clicks = prev_round.clicks
+            ranges = GSP.bid_ranges(clicks, reserve, other_bids)
         def compute(s):
-            (min, max) = GSP.bid_range_for_slot(s, clicks, reserve, other_bids)
+            (min, max) = ranges[s]
             if max == None:
                 max = 2 * min
             return (s, min, max)
@@ -41,17 +47,19 @@ class rwjlbb:
         return info
 
 
-    def expected_utils(self, t, history, reserve):
+    def expected_utils(self, t, history, reserve, market=None, info=None):
         """
         Figure out the expected utility of bidding such that we win each
         slot, assuming that everyone else keeps their bids constant from
-        the previous round.
+        the previous round.  info is the slot_info() of this round, if it
+        was already computed.
 
         returns a list of utilities per slot.
         """
-        info = self.slot_info(t, history, reserve)
+        if info is None:
+            info = self.slot_info(t, history, reserve, market)
         # pos_effects = [history.round(t-1).clicks[0] * (0.75 ** j) for j in range(0, len(info))]
-        pos_effects = history.round(t-1).clicks
+        pos_effects = list(history.round(t-1).clicks)
         pos_effects = pos_effects + [0] * (len(info) - len(pos_effects))
 
         prices = [low for slot, low, high in info] + [max(0, reserve)]
@@ -64,7 +72,7 @@ class rwjlbb:
 
         return utilities
 
-    def target_slot(self, t, history, reserve):
+    def target_slot(self, t, history, reserve, market=None, info=None):
         """Figure out the best slot to target, assuming that everyone else
         keeps their bids constant from the previous rounds.
 
@@ -72,11 +80,13 @@ class rwjlbb:
         the other-agent bid for that slot in the last round.  If slot_id = 0,
         max_bid is min_bid * 2
         """
-        i =  argmax_index(self.expected_utils(t, history, reserve))
-        info = self.slot_info(t, history, reserve)
+        if info is None:
+            info = self.slot_info(t, history, reserve, market)
+        i =  argmax_index(self.expected_utils(t, history, reserve, market,
+                                              info))
         return info[i]
 
-    def bid(self, t, history, reserve):
+    def bid(self, t, history, reserve, market=None):
         # The Balanced bidding strategy (BB) is the strategy for a player j that, given
         # bids b_{-j},
         # - targets the slot s*_j which maximizes his utility, that is,
@@ -87,9 +97,12 @@ class rwjlbb:
         # (p_x is the price/click in slot x)
         # If s*_j is the top slot, bid the value v_j
 
-        (slot, min_bid, max_bid) = self.target_slot(t, history, reserve)
+        # The slot prices are worked out once, and shared with
+        # target_slot() and expected_utils()
+        info = self.slot_info(t, history, reserve, market)
+        (slot, min_bid, max_bid) = self.target_slot(t, history, reserve,
+                                                    market, info)
 
-        info = self.slot_info(t, history, reserve)
         prices = [low for _, low, _ in info]
         t_j = prices[slot] if slot < len(prices) else max(0, reserve)
 
@@ -110,9 +123,3 @@ class rwjlbb:
                 bid = self.value
 
         return bid
-
-    def __repr__(self):
-        return "%s(id=%d, value=%d)" % (
-            self.__class__.__name__, self.id, self.value)
-
-
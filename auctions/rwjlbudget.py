@@ -3,16 +3,18 @@
 import sys
 import math
 
+from agent import Agent
+from clicks import cosine_traffic
 from gsp import GSP
 from util import argmax_index
 
-class rwjlbudget_cos:
+class rwjlbudget_cos(Agent):
     """Balanced bidding agent"""
-    def __init__(self, id, value, budget):
-        self.id = id
-        self.value = value
-        self.budget = budget
-        self.N_ROUNDS = 48
+    __slots__ = ('attractiveness_history', 'top_bid')
+    N_ROUNDS = 48
+
+    def reset(self, value, budget):
+        Agent.reset(self, value, budget)
         self.attractiveness_history = []
         self.top_bid = [10e10]
 
@@ -34,8 +36,9 @@ class rwjlbudget_cos:
         other_bids = filter(lambda (a_id, b): a_id != self.id, prev_round.bids)
 
         clicks = prev_round.clicks
+        ranges = GSP.bid_ranges(clicks, reserve, other_bids)
         def compute(s):
-            (min, max) = GSP.bid_range_for_slot(s, clicks, reserve, other_bids)
+            (min, max) = ranges[s]
             if max == None:
                 max = 2 * min
             return (s, min, max)
@@ -92,7 +95,10 @@ class rwjlbudget_cos:
                 bids += [b for (_, b) in history.round(t-lag).bids]
             
             price_level = sum(bids) / float(len(bids))
-            normed_value = 30 * math.cos(math.pi * t / 24) + 50
+            if history.click_model is not None:
+                normed_value = history.click_model.traffic(t)
+            else:
+                normed_value = cosine_traffic(t)
             attractiveness = normed_value / price_level
             attractiveness_delta = (attractiveness - self.attractiveness_history[-1]) / float(attractiveness)
         else:
@@ -105,9 +111,3 @@ class rwjlbudget_cos:
         bid = base_bid * (1 + attractiveness_delta)
 
         return bid
-
-    def __repr__(self):
-        return "%s(id=%d, value=%d)" % (
-            self.__class__.__name__, self.id, self.value)
-
-
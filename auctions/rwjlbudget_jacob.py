@@ -2,17 +2,18 @@
 
 import sys
 
+from agent import Agent
 from gsp import GSP
 from util import argmax_index
 
-class rwjlbudget_jacob:
+class rwjlbudget_jacob(Agent):
     """Balanced bidding agent"""
-    def __init__(self, id, value, budget):
-        self.id = id
-        self.value = value
+    __slots__ = ('orig_budget',)
+    N_ROUNDS = 48
+
+    def reset(self, value, budget):
+        Agent.reset(self, value, budget)
         self.orig_budget = budget
-        self.budget = budget
-        self.N_ROUNDS = 48
 
     def initial_bid(self, reserve):
         return self.value / 2
@@ -32,8 +33,9 @@ class rwjlbudget_jacob:
         other_bids = filter(lambda (a_id, b): a_id != self.id, prev_round.bids)
 
         clicks = prev_round.clicks
+        ranges = GSP.bid_ranges(clicks, reserve, other_bids)
         def compute(s):
-            (min, max) = GSP.bid_range_for_slot(s, clicks, reserve, other_bids)
+            (min, max) = ranges[s]
             if max == None:
                 max = 2 * min
             return (s, min, max)
@@ -83,9 +85,3 @@ class rwjlbudget_jacob:
         bid = min(float(t)/self.N_ROUNDS * self.budget, self.value)
 
         return bid
-
-    def __repr__(self):
-        return "%s(id=%d, value=%d)" % (
-            self.__class__.__name__, self.id, self.value)
-
-
@@ -3,12 +3,56 @@
 import logging
 from pprint import pformat
 
+class RunningTotals:
+    """
+    Per-agent utility and clicks, and total revenue, added up by the
+    simulator as each round is run.  Spend comes from the simulation's
+    SpendLedger.
+    """
+    def __init__(self, values, ledger):
+        self.values = values  # dict id->value
+        self.ledger = ledger
+        self.utility = dict((id, 0) for id in values)
+        self.clicks = dict((id, 0) for id in values)
+        self.revenue = 0
+
+    def record(self, occupants, clicks, per_click_payments, slot_payments):
+        """Add one round, as computed by the mechanism."""
+        for (id, c, p) in zip(occupants, clicks, per_click_payments):
+            # Same expression as Stats.total_utility, so the sums match
+            self.utility[id] += c * (self.values[id] - p)
+            self.clicks[id] += c
+        self.revenue += sum(slot_payments)
+
+    def spent(self, id):
+        return self.ledger.spent(id)
+
+
 class Stats:
-    def __init__(self, history, values):
+    def __init__(self, history, values, replay=False):
+        """
+        Reads the running totals the simulator kept, if they were computed
+        with the same values.  With replay=True, always recomputes everything
+        from the round history instead, which is useful to check the totals.
+        """
         self.history = history
         self.values = values  # dict id->value
+        self.replay = replay
+
+    def running_totals(self, id=None):
+        """The simulator's RunningTotals, if they can be used for id."""
+        totals = getattr(self.history, 'totals', None)
+        if totals is None or self.replay:
+            return None
+        if id is not None and totals.values.get(id) != self.values.get(id):
+            return None
+        return totals
 
     def total_utility(self, id, verbose=False):
+        totals = self.running_totals(id)
+        if totals is not None and not verbose:
+            return totals.utility[id]
+
         def util(t):
             round = self.history.round(t)
             if id not in round.occupants:
@@ -25,12 +69,36 @@ class Stats:
         
         return sum(util(t) for t in range(rounds))
 
+    def total_clicks(self, id):
+        totals = self.running_totals()
+        if totals is not None:
+            return totals.clicks[id]
+
+        clicks = 0
+        for t in range(self.history.num_rounds()):
+            r = self.history.round(t)
+            if id in r.occupants:
+                clicks += r.clicks[r.occupants.index(id)]
+        return clicks
+
+    def total_spent(self, id):
+        totals = self.running_totals()
+        if totals is not None:
+            return totals.spent(id)
+
+        spent = 0
+        for t in range(self.history.num_rounds()):
+            r = self.history.round(t)
+            if id in r.occupants:
+                spent += r.slot_payments[r.occupants.index(id)]
+        return spent
+
     def total_revenue(self):
-        rev = 0
-        def slot_payments(slot_clicks, per_click_payments):
-            return map(lambda (x,y): x*y,
-                       zip(slot_clicks, per_click_payments))
+        totals = self.running_totals()
+        if totals is not None:
+            return totals.revenue
 
+        rev = 0
         for i in range(self.history.num_rounds()):
             r = self.history.round(i)
             rev += sum(r.slot_payments)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+
+# Value assignments that only differ by swapping values between agents of
+# the same class lead to the same outcome distribution (with the agents'
+# results swapped too), so a sweep only has to simulate one of each.
+
+import itertools
+import math
+
+
+def class_groups(class_names):
+    """
+    Group agent ids by class.  Returns a list of lists of ids, in order of
+    each class's first agent.
+    """
+    groups = {}
+    order = []
+    for (a_id, name) in enumerate(class_names):
+        if name not in groups:
+            groups[name] = []
+            order.append(name)
+        groups[name].append(a_id)
+    return [groups[name] for name in order]
+
+
+def num_assignments(groups):
+    """
+    Upper bound on the number of distinct assignments: the multinomial
+    n! / (k_1! k_2! ...), which is exact when the values are distinct.
+    """
+    n = sum(len(g) for g in groups)
+    count = math.factorial(n)
+    for g in groups:
+        count //= math.factorial(len(g))
+    return count
+
+
+def distinct_assignments(values, groups):
+    """
+    One representative for every class of value assignments that are equal
+    up to relabeling agents within a group.  Returns a list of
+    (vals, weight) pairs, where vals[id] is the value of agent id, and
+    weight is how many of the len(values)! permutations of values (as
+    itertools.permutations generates them) fall in the class.  The weights
+    add up to len(values)!.
+    """
+    n = len(values)
+    counts = {}
+
+    def assign(g, remaining, key):
+        if g == len(groups):
+            counts[key] = counts.get(key, 0) + 1
+            return
+        for chosen in itertools.combinations(remaining, len(groups[g])):
+            rest = [i for i in remaining if i not in chosen]
+            group_values = tuple(sorted(values[i] for i in chosen))
+            assign(g + 1, rest, key + (group_values,))
+
+    assign(0, range(n), ())
+
+    # Each way of splitting the positions of values into groups stands for
+    # all the orders of each group's values among its agents.
+    orders = 1
+    for g in groups:
+        orders *= math.factorial(len(g))
+
+    assignments = []
+    for key in sorted(counts):
+        vals = [None] * n
+        for (g, group_values) in zip(groups, key):
+            for (a_id, v) in zip(g, group_values):
+                vals[a_id] = v
+        assignments.append((vals, counts[key] * orders))
+    return assignments
+
+
+def group_average(xs, groups):
+    """Replace each agent's number with the average over its group."""
+    averaged = list(xs)
+    for g in groups:
+        avg = sum(xs[a_id] for a_id in g) / float(len(g))
+        for a_id in g:
+            averaged[a_id] = avg
+    return averaged
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+
+# Binary traces of full simulation histories (--trace DIR).
+#
+# Rounds are stacked into columnar .npy shards, one file per column:
+#   <shard>.bids.npy                rounds x agents, float
+#   <shard>.occupants.npy           rounds x slots, id or -1
+#   <shard>.clicks.npy              rounds x slots
+#   <shard>.per_click_payments.npy  rounds x slots, float
+#   <shard>.slot_payments.npy       rounds x slots, float
+# and index-<pid>.jsonl has a line per simulation, with its shard, first row,
+# number of rounds, values and seed.  Every process (the sweep and each pool
+# worker) writes its own shards and index, so they never contend.  A shard
+# is written out when it fills up, and only then added to the index, so the
+# index only points at complete files.
+#
+# Trace reads a trace back, memory-mapping the shards.
+
+import glob
+import json
+import os
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from multiprocessing.util import Finalize
+
+COLUMNS = ['bids', 'occupants', 'clicks', 'per_click_payments',
+           'slot_payments']
+
+
+class TraceWriter:
+    """
+    Appends simulations to the trace in directory.  Buffers up to
+    shard_rounds rounds in memory before writing a shard; close() writes
+    the last one.
+    """
+    def __init__(self, directory, agent_class_names, num_slots,
+                 shard_rounds=65536):
+        if np is None:
+            raise ImportError("traces require numpy")
+        self.directory = directory
+        self.n_agents = len(agent_class_names)
+        self.num_slots = num_slots
+        self.shard_rounds = shard_rounds
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(os.path.join(directory, 'trace.json'), 'w') as f:
+            json.dump({'agents': list(agent_class_names),
+                       'num_slots': num_slots,
+                       'columns': COLUMNS}, f)
+        self.pid = None
+
+    def _start(self):
+        """Start writing from this process.  Pool workers get a copy of the
+        writer, and start their own shards and index."""
+        self.pid = os.getpid()
+        self.num_shards = 0
+        self.index = open(os.path.join(self.directory,
+                                       'index-%d.jsonl' % self.pid), 'a')
+        self._new_shard()
+        # Worker processes never return to the sweep, so they write their
+        # last shard when they exit.
+        Finalize(self, TraceWriter.close, args=(self,), exitpriority=10)
+
+    def _new_shard(self):
+        n = self.shard_rounds
+        self.shard = "p%d-%05d" % (self.pid, self.num_shards)
+        self.num_shards += 1
+        self.rows = 0
+        self.entries = []
+        self.buffers = {
+            'bids': np.zeros((n, self.n_agents)),
+            'occupants': np.full((n, self.num_slots), -1, np.int32),
+            'clicks': np.zeros((n, self.num_slots), np.int64),
+            'per_click_payments': np.zeros((n, self.num_slots)),
+            'slot_payments': np.zeros((n, self.num_slots)),
+        }
+
+    def add(self, rounds, values, seed):
+        """
+        Add a simulation, given its RoundHistory records (or tuples laid out
+        the same way), in order, along with its values and seed.
+        """
+        if self.pid != os.getpid():
+            self._start()
+        if self.rows + len(rounds) > self.shard_rounds and self.rows > 0:
+            self.flush()
+        if len(rounds) > self.shard_rounds:
+            raise ValueError("a simulation of %d rounds doesn't fit in "
+                             "shards of %d" % (len(rounds), self.shard_rounds))
+
+        b = self.buffers
+        start = self.rows
+        for (t, (bids, occupants, clicks, per_click_payments,
+                 slot_payments)) in enumerate(rounds):
+            row = start + t
+            for (a_id, bid) in bids:
+                b['bids'][row, a_id] = bid
+            k = len(occupants)
+            b['occupants'][row, :k] = occupants
+            b['clicks'][row, :len(clicks)] = clicks
+            b['per_click_payments'][row, :k] = per_click_payments
+            b['slot_payments'][row, :k] = slot_payments
+        self.rows += len(rounds)
+        self.entries.append({'shard': self.shard,
+                             'start': start,
+                             'num_rounds': len(rounds),
+                             'values': list(values),
+                             'seed': seed})
+
+    def flush(self):
+        """Write the current shard, and index its simulations."""
+        if self.pid != os.getpid() or self.rows == 0:
+            return
+        for name in COLUMNS:
+            path = os.path.join(self.directory,
+                                "%s.%s.npy" % (self.shard, name))
+            tmp = path + '.tmp'
+            with open(tmp, 'wb') as f:
+                np.save(f, self.buffers[name][:self.rows])
+            os.rename(tmp, path)
+        for entry in self.entries:
+            self.index.write(json.dumps(entry) + "\n")
+        self.index.flush()
+        self._new_shard()
+
+    def close(self):
+        if self.pid == os.getpid() and not self.index.closed:
+            self.flush()
+            self.index.close()
+
+
+class Trace:
+    """
+    A trace written by TraceWriter.  simulations is the list of index
+    entries; shards are memory-mapped when first used, so scanning them
+    doesn't read everything into memory.
+    """
+    def __init__(self, directory):
+        if np is None:
+            raise ImportError("traces require numpy")
+        self.directory = directory
+        with open(os.path.join(directory, 'trace.json')) as f:
+            meta = json.load(f)
+        self.agents = meta['agents']
+        self.num_slots = meta['num_slots']
+        self.simulations = []
+        for path in sorted(glob.glob(os.path.join(directory,
+                                                  'index-*.jsonl'))):
+            with open(path) as f:
+                self.simulations.extend(json.loads(line) for line in f)
+        self._shards = {}
+
+    def shards(self):
+        """Names of the shards, in index order."""
+        names = []
+        for entry in self.simulations:
+            if not names or names[-1] != entry['shard']:
+                names.append(entry['shard'])
+        return names
+
+    def column(self, shard, name):
+        """The memory-mapped array of column name in shard."""
+        key = (shard, name)
+        if key not in self._shards:
+            path = os.path.join(self.directory, "%s.%s.npy" % key)
+            self._shards[key] = np.load(path, mmap_mode='r')
+        return self._shards[key]
+
+    def simulation(self, i):
+        """dict of column name -> array of the rounds of simulation i.
+        The arrays are views of the memory maps."""
+        entry = self.simulations[i]
+        rows = slice(entry['start'], entry['start'] + entry['num_rounds'])
+        return dict((name, self.column(entry['shard'], name)[rows])
+                    for name in COLUMNS)
+
+    def num_rounds(self):
+        return sum(entry['num_rounds'] for entry in self.simulations)
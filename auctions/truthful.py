@@ -1,14 +1,16 @@
 #!/usr/bin/env python
 
+from agent import Agent
 from gsp import GSP
 from util import argmax_index
 
-class Truthful:
+class Truthful(Agent):
     """Truthful bidding agent"""
-    def __init__(self, id, value, budget):
-        self.id = id
-        self.value = value
-        self.budget = budget
+    # Bids only depend on the value, so lockstep.py can run many
+    # permutations of these agents at once.
+    vectorizable = True
+
+    __slots__ = ()
 
     def initial_bid(self, reserve):
         return self.value
@@ -17,8 +19,10 @@ class Truthful:
     def bid(self, t, history, reserve):
         return self.value
 
-    def __repr__(self):
-        return "%s(id=%d, value=%d)" % (
-            self.__class__.__name__, self.id, self.value)
-
+    @staticmethod
+    def batch_initial_bid(values, reserve):
+        return values
 
+    @staticmethod
+    def batch_bid(t, values, reserve):
+        return values
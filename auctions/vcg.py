@@ -2,7 +2,7 @@
 
 import random
 
-from gsp import GSP
+from gsp import GSP, np, rank_batch, ranked_bids
 
 from math import cos, pi
 
@@ -29,56 +29,88 @@ class VCG:
         """
 
         # The allocation is the same as GSP, so we filled that in for you...
-        valid = lambda (a, bid): bid >= reserve
-        valid_bids = filter(valid, bids)
-
-        bid_dict = dict(bids)
-
-        rev_cmp_bids = lambda (a1, b1), (a2, b2): cmp(b2, b1)
-        # shuffle first to make sure we don't have any bias for lower or
-        # higher ids
-        random.shuffle(valid_bids)
-        valid_bids.sort(rev_cmp_bids)
-
         num_slots = len(slot_clicks)
+        valid_bids = ranked_bids(reserve, bids, num_slots)
         allocated_bids = valid_bids[:num_slots]
-        unallocated_bids = list(set(valid_bids) - set(allocated_bids))
         if len(allocated_bids) == 0:
             return ([], [])
 
         (allocation, just_bids) = zip(*allocated_bids)
 
         # get value of the highest unallocated bid
-        if unallocated_bids:
-            highest_unalloc_bid = max(zip(*unallocated_bids)[1])
+        if len(valid_bids) > num_slots:
+            highest_unalloc_bid = valid_bids[num_slots][1]
         else:
             highest_unalloc_bid = 0
 
-        # TODO: You just have to implement this function
-        def total_payment(k):
-            """
-            Total payment for a bidder in slot k.
-            """
-            c = slot_clicks
-            n = len(allocation)
-
-            if k == n - 1:
-                return c[k] * max(reserve, highest_unalloc_bid)
-            elif k < num_slots:
-                return (c[k] - c[k+1]) * just_bids[k+1] + total_payment(k + 1)
-            else:
-                return c[k] * max(reserve, just_bids[k+1])
-
+        # The bidder in slot k pays, for each slot j >= k, the clicks they
+        # take from the bidder below them at that bidder's bid, so the
+        # totals are a cumulative sum from the bottom slot up.
+        c = slot_clicks
+        n = len(allocation)
+        totals = [0] * n
+        total = c[n-1] * max(reserve, highest_unalloc_bid)
+        totals[n-1] = total
+        for k in range(n-2, -1, -1):
+            total = (c[k] - c[k+1]) * just_bids[k+1] + total
+            totals[k] = total
 
         def norm(totals):
             """Normalize total payments by the clicks in each slot"""
-            return map(lambda (x,y): x/y, zip(totals, slot_clicks))
+            return map(lambda (x,y): x/y if y else 0,
+                       zip(totals, slot_clicks))
 
-        per_click_payments = norm(
-            [total_payment(k) for k in range(len(allocation))])
+        per_click_payments = norm(totals)
 
         return (list(allocation), per_click_payments)
 
+    @staticmethod
+    def compute_batch(slot_clicks, reserve, bids, rng=None):
+        """
+        Run many auctions at once, like GSP.compute_batch: bids is an
+        (auctions x bidders) array, slot_clicks is the clicks for each slot
+        (or one such row per auction), and reserve is a scalar or one reserve
+        per auction.
+
+        Returns (allocation, per_click_payments) as (auctions x slots)
+        arrays, with -1 and 0 in slots nobody fills.  Payments are
+        normalized like compute(): integer division if everything is an
+        integer.  Slots with no clicks have a per-click payment of 0.
+        """
+        num_slots = np.shape(slot_clicks)[-1]
+        (order, sorted_bids, num_valid, reserves) = rank_batch(
+            reserve, bids, num_slots + 1, rng)
+        (m, _) = order.shape
+        clicks = np.broadcast_to(slot_clicks, (m, num_slots))
+
+        slots = np.arange(num_slots)
+        num_filled = np.minimum(num_valid, num_slots)[:, np.newaxis]
+        filled = slots < num_filled
+        allocation = np.where(filled, order[:, :num_slots], -1)
+
+        # Price of the clicks each slot takes from the one below it: the
+        # next bid, or the reserve (at least 0) below the last valid bid.
+        priced = slots + 1 < num_valid[:, np.newaxis]
+        prices = np.where(priced, sorted_bids[:, 1:],
+                          np.maximum(reserves, 0))
+
+        # Clicks taken from the next slot down, with the bottom filled slot
+        # taking all of its clicks
+        below = np.hstack([clicks[:, 1:], np.zeros((m, 1), clicks.dtype)])
+        below = np.where(slots + 1 < num_filled, below, 0)
+        marginal = np.where(filled, (clicks - below) * prices, 0)
+        totals = np.cumsum(marginal[:, ::-1], axis=1)[:, ::-1]
+
+        has_clicks = filled & (clicks != 0)
+        denominators = np.where(has_clicks, clicks, 1)
+        if (np.issubdtype(totals.dtype, np.integer) and
+            np.issubdtype(denominators.dtype, np.integer)):
+            per_click_payments = totals // denominators
+        else:
+            per_click_payments = totals / denominators.astype(float)
+        per_click_payments = np.where(has_clicks, per_click_payments, 0)
+        return (allocation, per_click_payments)
+
     @staticmethod
     def bid_range_for_slot(slot, slot_clicks, reserve, bids):
         """
@@ -89,3 +121,10 @@ class VCG:
         """
         # Conveniently enough, bid ranges are the same for GSP and VCG:
         return GSP.bid_range_for_slot(slot, slot_clicks, reserve, bids)
+
+    @staticmethod
+    def bid_ranges(slot_clicks, reserve, bids):
+        """
+        The (min_bid, max_bid) of every slot, like bid_range_for_slot.
+        """
+        return GSP.bid_ranges(slot_clicks, reserve, bids)
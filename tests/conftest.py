@@ -0,0 +1,28 @@
+#!/usr/bin/env python
+
+# Fixtures shared by the test modules.
+
+import pytest
+
+from auction import Params, load_modules
+
+
+def new_config(class_names, values, budget=500000, mechanism='gsp',
+               reserve=0, num_rounds=48):
+    """A sim() configuration for agents of class_names with values."""
+    config = Params()
+    config.add('agent_class_names', class_names)
+    config.add('agent_classes', load_modules(set(class_names)))
+    config.add('agent_values', values)
+    config.add('budget', budget)
+    config.add('mechanism', mechanism)
+    config.add('reserve', reserve)
+    config.add('num_rounds', num_rounds)
+    config.add('dropoff', 0.75)
+    return config
+
+
+@pytest.fixture
+def make_config():
+    """Makes sim() configurations: new_config()."""
+    return new_config
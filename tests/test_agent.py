@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+
+import pytest
+
+from agent import Agent, AgentPool, reusable
+from auction import run_perm
+from rwjlbudget_cos import rwjlbudget_cos
+from rwjlbudget_jacob import rwjlbudget_jacob
+from truthful import Truthful
+
+
+def test_slots():
+    a = Truthful(2, 80, 1000)
+    assert not hasattr(a, '__dict__')
+    with pytest.raises(AttributeError):
+        a.scratch = 1
+    assert repr(a) == "Truthful(id=2, value=80)"
+
+
+def test_reset():
+    a = rwjlbudget_cos(1, 80, 1000)
+    a.attractiveness_history.append(3)
+    a.reset(60, 500)
+    assert (a.id, a.value, a.budget) == (1, 60, 500)
+    assert a.attractiveness_history == []
+    assert a.top_bid == [10e10]
+
+    b = rwjlbudget_jacob(0, 80, 1000)
+    b.budget = 10
+    b.reset(90, 2000)
+    assert (b.value, b.budget, b.orig_budget) == (90, 2000, 2000)
+
+
+class Constructed(Agent):
+    """Sets up state in __init__, so it can't just be reset."""
+    __slots__ = ('rounds',)
+
+    def __init__(self, id, value, budget):
+        Agent.__init__(self, id, value, budget)
+        self.rounds = []
+
+
+class OldStyle:
+    def __init__(self, id, value, budget):
+        self.id = id
+
+
+def test_reusable():
+    assert reusable(Truthful)
+    assert reusable(rwjlbudget_cos)
+    assert not reusable(Constructed)
+    assert not reusable(OldStyle)
+
+
+def test_pool():
+    classes = {'Truthful': Truthful, 'Constructed': Constructed}
+    names = ['Truthful', 'Constructed', 'Truthful']
+    pool = AgentPool(names, classes)
+    first = pool.agents([10, 20, 30], 100)
+    second = pool.agents([30, 10, 20], 200)
+    assert first[0] is second[0] and first[2] is second[2]
+    assert first[1] is not second[1]
+    assert [(a.id, a.value, a.budget) for a in second] == [
+        (0, 30, 200), (1, 10, 200), (2, 20, 200)]
+    assert pool.matches(names, classes)
+    assert not pool.matches(names[:2], classes)
+
+
+def test_reused_agents_match_new_ones(make_config):
+    names = ['rwjlbudget_cos', 'rwjlbudget_jacob', 'Truthful']
+    perms = [[40, 95, 150], [150, 40, 95], [95, 150, 40]]
+    reused = make_config(names, [0] * 3, budget=3000)
+    results = [run_perm(reused, vals, seed)
+               for (seed, vals) in enumerate(perms)]
+    for (seed, vals) in enumerate(perms):
+        fresh = make_config(names, [0] * 3, budget=3000)
+        assert run_perm(fresh, vals, seed) == results[seed]
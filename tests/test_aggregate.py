@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+# http://pytest.org/
+# run py.test to run the tests (it magically finds things
+# called test_blah and runs them)
+
+import json
+import math
+import random
+from StringIO import StringIO
+
+import pytest
+
+from aggregate import RunningMoments, SweepAggregator
+from util import mean, stddev
+
+
+def test_running_moments():
+    random.seed(0)
+    xs = [random.uniform(-50, 500) for i in range(1000)]
+    m = RunningMoments()
+    assert m.stderr() is None
+    for x in xs:
+        m.add(x)
+    assert m.n == len(xs)
+    assert m.mean == pytest.approx(mean(xs))
+    assert m.stddev() == pytest.approx(stddev(xs))
+
+    sample_var = sum((x - mean(xs)) ** 2 for x in xs) / (len(xs) - 1)
+    assert m.stderr() == pytest.approx(math.sqrt(sample_var / len(xs)))
+    (low, high) = m.ci95()
+    assert low < m.mean < high
+    assert high - low == pytest.approx(2 * 1.96 * m.stderr(), rel=1e-3)
+
+
+def test_sweep_jsonl():
+    out = StringIO()
+    agg = SweepAggregator(['Truthful', 'rwjlbb'], out)
+    agg.add_iteration(0, [30, 60], 100.0, [5.0, 7.0], [1.0, 2.0])
+    agg.add_iteration(1, [40, 20], 300.0, [9.0, 3.0], [3.0, 0.0])
+
+    lines = [json.loads(l) for l in out.getvalue().splitlines()]
+    assert [l['iteration'] for l in lines] == [0, 1]
+    assert lines[0]['running']['revenue']['stderr'] is None
+    running = lines[1]['running']
+    assert running['revenue']['mean'] == 200.0
+    assert running['revenue']['stderr'] == pytest.approx(100.0)
+    assert running['agents'][1]['class'] == 'rwjlbb'
+    assert running['agents'][0]['utility']['mean'] == 7.0
+    assert running['agents'][1]['spend']['mean'] == 1.0
+
+
+def test_converged():
+    agg = SweepAggregator(['Truthful'])
+    agg.add_iteration(0, [30], 100.0, [5.0], [1.0])
+    # One sample has no standard error yet
+    assert not agg.converged(1000)
+    agg.add_iteration(1, [40], 104.0, [5.0], [1.0])
+    assert agg.converged(2.0)
+    assert not agg.converged(1.9)
+    agg.add_iteration(2, [50], 102.0, [50.0], [1.0])
+    # Revenue has settled, but the agent's utility hasn't
+    assert agg.revenue.stderr() < 2.0
+    assert not agg.converged(2.0)
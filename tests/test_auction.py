@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+# http://pytest.org/
+# run py.test to run the tests (it magically finds things
+# called test_blah and runs them)
+
+import itertools
+import json
+import multiprocessing
+import random
+
+import pytest
+
+from auction import _init_tasks, main, perm_results, run_perm
+from lockstep import can_lockstep, lockstep_perms
+
+
+def test_run_perm_is_seeded(make_config):
+    config = make_config(['Truthful', 'rwjlbb', 'rwjlbb'], [0, 0, 0])
+    random.seed(1)
+    state = random.getstate()
+    first = run_perm(config, [30, 110, 70], 99)
+    # The caller's random state is untouched
+    assert random.getstate() == state
+    assert run_perm(config, [30, 110, 70], 99) == first
+
+
+def test_pool_matches_serial(make_config):
+    config = make_config(['Truthful', 'rwjlbb', 'rwjlbudget_jacob'],
+                         [0, 0, 0], budget=3000)
+    tasks = [(list(vals), seed) for (seed, vals) in
+             enumerate(itertools.permutations([40, 95, 150]))]
+
+    _init_tasks(config)
+    serial = list(perm_results(None, 1, tasks))
+
+    pool = multiprocessing.Pool(2, _init_tasks, (config,))
+    try:
+        parallel = list(perm_results(pool, 2, tasks))
+    finally:
+        pool.close()
+        pool.join()
+    assert parallel == serial
+
+
+def test_lockstep_matches_sim(make_config):
+    np = pytest.importorskip('numpy')
+    config = make_config(['Truthful'] * 4, [0] * 4, budget=20000, reserve=30)
+    perms = [list(vals) for vals in itertools.permutations([25, 60, 95, 170])]
+    assert can_lockstep(config.agent_classes.values())
+
+    for mechanism in ['gsp', 'vcg', 'switch']:
+        config.mechanism = mechanism
+        # Values are distinct, so tie-breaking can't make these differ
+        expected = [run_perm(config, vals, 0) for vals in perms]
+        results = lockstep_perms(config, perms, np.random.RandomState(0))
+        assert [tuple(r) for r in results] == [tuple(r) for r in expected]
+
+
+def test_lockstep_needs_vectorizable_agents(make_config):
+    config = make_config(['Truthful', 'rwjlbb'], [0, 0])
+    assert not can_lockstep(config.agent_classes.values())
+
+
+def test_lockstep_draws_same_values(tmpdir):
+    pytest.importorskip('numpy')
+    def sweep(*flags):
+        path = str(tmpdir.join('sweep%d.jsonl' % len(flags)))
+        main(['auction.py', '--loglevel', 'error', '--seed', '3',
+              '--iters', '3', '--num-rounds', '12', '--jsonl', path] +
+             list(flags) + ['Truthful,3'])
+        with open(path) as f:
+            return [json.loads(line) for line in f]
+
+    serial = sweep()
+    lockstep = sweep('--lockstep')
+    assert ([r['values'] for r in lockstep] ==
+            [r['values'] for r in serial])
+    assert ([r['revenue'] for r in lockstep] ==
+            pytest.approx([r['revenue'] for r in serial]))
+
+
+def test_tolerance_needs_a_cap(capsys):
+    with pytest.raises(SystemExit):
+        main(['auction.py', '--tolerance', '5', 'Truthful,3'])
+    assert "--tolerance needs a --max-iters" in capsys.readouterr()[0]
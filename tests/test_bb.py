@@ -4,7 +4,7 @@
 # run py.test to run the tests (it magically finds things
 # called test_blah and runs them)
 
-from auction import History
+from history import History
 from rwjlbb import rwjlbb as BBAgent
 
 
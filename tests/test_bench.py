@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+
+import json
+import logging
+import multiprocessing
+import sys
+
+import pytest
+
+import auction
+import bench
+
+
+def result(label, seconds, n_agents=3, num_rounds=48):
+    return {'benchmark': 'sim', 'label': label, 'n_agents': n_agents,
+            'num_rounds': num_rounds, 'value': seconds, 'unit': 's'}
+
+
+def test_compare():
+    baseline = [result('sim', 1.0), result('sim', 2.0, n_agents=10)]
+    current = [result('sim', 1.5), result('sim', 2.1, n_agents=10),
+               result('sim', 9.0, n_agents=100)]
+    report = bench.compare(baseline, current, 0.2)
+    assert [(old, regressed) for (r, old, ratio, regressed) in report] == [
+        (1.0, True), (2.0, False)]
+    assert report[0][2] == 1.5
+
+
+def test_json_results(tmpdir):
+    out = str(tmpdir.join('bench.json'))
+    bench.main(['bench.py', '--agents', '3,4', '--num-rounds', '5',
+                '--repeat', '1', '--json', out, 'mechanisms', 'sim'])
+    with open(out) as f:
+        results = json.load(f)['results']
+    assert set((r['label'], r['n_agents'], r['num_rounds'])
+               for r in results) == set([
+        ('GSP.compute', 3, None), ('VCG.compute', 3, None),
+        ('GSP.bid_range_for_slot', 3, None),
+        ('GSP.compute', 4, None), ('VCG.compute', 4, None),
+        ('GSP.bid_range_for_slot', 4, None),
+        ('sim', 3, 5), ('sim', 4, 5)])
+    assert all(r['value'] >= 0 and r['unit'] == 's' for r in results)
+
+    # Comparing with itself finds no regressions
+    bench.main(['bench.py', '--agents', '3', '--num-rounds', '5',
+                '--repeat', '1', '--baseline', out, '--threshold', '100',
+                'sim'])
+
+
+def _exit_early(queue):
+    sys.exit(3)
+
+
+def test_child_result_when_child_dies():
+    queue = multiprocessing.Queue()
+    p = multiprocessing.Process(target=_exit_early, args=(queue,))
+    p.start()
+    with pytest.raises(RuntimeError):
+        bench.child_result(p, queue, poll=0.05)
+
+
+def test_configure_logging_adds_one_handler():
+    auction.configure_logging('error')
+    handlers = len(logging.getLogger('').handlers)
+    auction.configure_logging('error')
+    assert len(logging.getLogger('').handlers) == handlers
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+import os
+
+import auction
+from auction import run_perm
+from cache import SimCache, sim_config
+
+
+def test_put_get(tmpdir):
+    cache = SimCache(str(tmpdir), 1024 * 1024)
+    assert cache.get('ab' * 20) is None
+    cache.put('ab' * 20, {'stats': ([1, 2], [3, 4], 5)})
+    assert cache.get('ab' * 20) == {'stats': ([1, 2], [3, 4], 5)}
+    # A fresh cache over the same directory sees the entry
+    assert SimCache(str(tmpdir), 1024 * 1024).get('ab' * 20) is not None
+
+
+def test_evicts_least_recently_used(tmpdir):
+    cache = SimCache(str(tmpdir), 1024 * 1024)
+    keys = ['%02x' % i * 20 for i in range(3)]
+    for (i, key) in enumerate(keys):
+        cache.put(key, 'x' * 1000)
+        os.utime(cache.path(key), (i, i))
+    # Using the oldest entry makes it the most recent
+    assert cache.get(keys[0]) is not None
+
+    cache.max_bytes = 2500
+    cache.evict()
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[2]) is not None
+    assert cache.size <= 2500
+
+
+def test_key_depends_on_config(tmpdir, make_config):
+    cache = SimCache(str(tmpdir), 1024 * 1024)
+    config = make_config(['Truthful', 'rwjlbb'], [0, 0])
+    key = cache.key(config, [30, 110], 7)
+    assert cache.key(config, [30, 110], 7) == key
+    assert cache.key(config, [110, 30], 7) != key
+    assert cache.key(config, [30, 110], 8) != key
+    config.reserve = 10
+    assert cache.key(config, [30, 110], 7) != key
+
+
+def test_run_perm_uses_cache(tmpdir, monkeypatch, make_config):
+    config = make_config(['Truthful', 'rwjlbb', 'rwjlbb'], [0, 0, 0])
+    expected = run_perm(config, [30, 110, 70], 99)
+
+    config.add('cache', SimCache(str(tmpdir), 1024 * 1024))
+    assert run_perm(config, [30, 110, 70], 99) == expected
+    entry = config.cache.get(config.cache.key(config, [30, 110, 70], 99))
+    assert len(entry['rounds']) == 48
+
+    def no_sim(*args):
+        raise AssertionError("should have been cached")
+    monkeypatch.setattr(auction, 'sim', no_sim)
+    assert run_perm(config, [30, 110, 70], 99) == expected
+
+
+def test_key_covers_imported_modules(make_config):
+    config = make_config(['Truthful', 'rwjlbb'], [0, 0])
+    sources = sim_config(config, [30, 110], 7)['sources']
+    # rwjlbb imports agent, gsp and util; gsp imports more of the simulator
+    for module in ['agent', 'util', 'lockstep', 'truthful', 'rwjlbb']:
+        assert module in sources
+    assert 'os' not in sources
+
+
+def test_replacing_an_entry_keeps_size(tmpdir):
+    cache = SimCache(str(tmpdir), 1024 * 1024)
+    cache.put('ab' * 20, 'x' * 1000)
+    size = cache.size
+    cache.put('ab' * 20, 'y' * 1000)
+    assert cache.size == size
+
+
+def test_unreadable_entry_is_a_miss(tmpdir):
+    cache = SimCache(str(tmpdir), 1024 * 1024)
+    cache.put('ab' * 20, {'stats': ([1, 2], [3, 4], 5)})
+    # A pickle of a class that no longer exists
+    with open(cache.path('ab' * 20), 'wb') as f:
+        f.write("cnowhere\nGone\np0\n.")
+    assert cache.get('ab' * 20) is None
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+
+import math
+
+import pytest
+
+from auction import sim
+from clicks import ClickModel, click_model_for, make_click_model
+
+
+def iround(x):
+    return int(round(x))
+
+
+def test_default_model():
+    model = make_click_model(48, 4)
+    for t in range(48):
+        top = iround(30*math.cos(math.pi*t/24) + 50)
+        assert model.clicks(t) == tuple(iround(top * pow(0.75, i))
+                                        for i in range(4))
+        assert model.traffic(t) == 30*math.cos(math.pi*t/24) + 50
+
+
+def test_future_clicks():
+    model = ClickModel(5, 2, lambda t: 10 * (t + 1), lambda t: [1, 0.5])
+    assert model.clicks(2) == (30, 15)
+    assert model.future_clicks(0, 0) == 150
+    assert model.future_clicks(3, 1) == 20 + 25
+    assert model.future_clicks(5, 0) == 0
+
+
+def test_cascade_and_empirical(tmpdir):
+    model = make_click_model(2, 3, 'cascade', 'flat')
+    assert model.clicks(0) == (50, iround(50 * 0.63), iround(50 * 0.63 ** 2))
+
+    path = tmpdir.join('ctr.txt')
+    path.write("# slot CTRs\n1, 0.5\n\n0.8 0.2\n")
+    model = make_click_model(3, 3, 'empirical', 'flat', ctr_file=str(path))
+    # Rows wrap around, and slots past the table get no clicks
+    assert [model.clicks(t) for t in range(3)] == [
+        (50, 25, 0), (40, 10, 0), (50, 25, 0)]
+
+    with pytest.raises(ValueError):
+        make_click_model(3, 3, 'empirical')
+    with pytest.raises(ValueError):
+        make_click_model(3, 3, traffic='bursty')
+
+
+def test_shared_by_simulations(make_config):
+    config = make_config(['Truthful', 'rwjlbb', 'rwjlbudget_cos'],
+                         [40, 95, 150])
+    model = click_model_for(config, 2)
+    assert click_model_for(config, 2) is model
+
+    history = sim(config)
+    assert history.click_model is model
+    for t in range(48):
+        assert tuple(history.round(t).clicks) == model.clicks(t)
+
+    config.add('click_model', make_click_model(48, 2, 'cascade'))
+    history = sim(config)
+    assert tuple(history.round(0).clicks) == (80, 50)
+
+
+def test_rebuilt_when_settings_change(make_config):
+    config = make_config(['Truthful'] * 3, [40, 95, 150])
+    model = click_model_for(config, 2)
+    config.add('traffic', 'flat')
+    flat = click_model_for(config, 2)
+    assert flat is not model
+    assert flat.clicks(0) == (50, 38)
+    config.dropoff = 0.5
+    assert click_model_for(config, 2).clicks(0) == (50, 25)
+    config.add('click_model_name', 'cascade')
+    assert click_model_for(config, 2).clicks(0) == (50, 32)
@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+
+# http://pytest.org/
+# run py.test to run the tests (it magically finds things
+# called test_blah and runs them)
+
+import random
+
+import pytest
+
+from auction import sim
+from columnar import ColumnarStore
+from stats import Stats
+
+np = pytest.importorskip('numpy')
+
+
+def run(make_config, columnar, mechanism):
+    random.seed(3)
+    config = make_config(['Truthful', 'rwjlbb', 'rwjlbb', 'rwjlbudget_jacob'],
+                         [40, 90, 130, 160], budget=4000, reserve=30,
+                         mechanism=mechanism)
+    config.add('columnar', columnar)
+    return sim(config)
+
+
+def number_types(r):
+    """The type of every number in the RoundHistory r."""
+    return ([type(b) for (_, b) in r.bids] +
+            [type(x) for xs in r[1:] for x in xs])
+
+
+def test_columnar_matches_lists(make_config):
+    values = dict(enumerate([40, 90, 130, 160]))
+    for mechanism in ['gsp', 'vcg']:
+        lists = run(make_config, False, mechanism)
+        columns = run(make_config, True, mechanism)
+
+        assert columns.num_rounds() == lists.num_rounds()
+        for t in range(lists.num_rounds()):
+            assert columns.round(t) == lists.round(t)
+            assert (number_types(columns.round(t)) ==
+                    number_types(lists.round(t)))
+
+        assert columns.agents_spent == lists.agents_spent
+
+        # Replayed from the stored rounds, the totals are the same
+        by_lists = Stats(lists, values, replay=True)
+        by_columns = Stats(columns, values, replay=True)
+        for a_id in range(4):
+            assert (by_columns.total_utility(a_id) ==
+                    by_lists.total_utility(a_id))
+            assert by_columns.total_spent(a_id) == by_lists.total_spent(a_id)
+        assert by_columns.total_revenue() == by_lists.total_revenue()
+
+
+def test_amounts_keep_their_types():
+    store = ColumnarStore(2, 1, 3)
+    store.record(0, [(0, 40), (1, 90)], [1], [10], [40], [400])
+    assert store.bids.dtype == np.int64
+    store.record(1, [(0, 40), (1, 62.5)], [1], [10], [40], [400])
+    store.record(2, [(0, 40), (1, 90)], [1], [10], [40.0], [400.0])
+    assert store.round_lists(0) == ([(0, 40), (1, 90)], [1], [10], [40],
+                                    [400])
+    assert [type(b) for (_, b) in store.round_lists(1)[0]] == [int, float]
+    assert [type(b) for (_, b) in store.round_lists(2)[0]] == [int, int]
+    assert map(type, store.round_lists(2)[3]) == [float]
+    assert map(type, store.round_lists(0)[4]) == [int]
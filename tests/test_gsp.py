@@ -4,7 +4,11 @@
 # run py.test to run the tests (it magically finds things
 # called test_blah and runs them)
 
-from gsp import GSP
+import random
+
+import pytest
+
+from gsp import GSP, cutoff_bid, is_large_market, top_bids
 
 def test_mechanism():
     num_slots = 4
@@ -71,3 +75,99 @@ def test_bid_ranges():
     assert bid_range(0, reserve) == (22, None)
     assert bid_range(1, reserve) == (22, 22)
     assert bid_range(2, reserve) == (22, 22)
+
+
+def test_compute_batch():
+    np = pytest.importorskip('numpy')
+    slot_clicks = [1] * 4
+    bids = zip(range(5), [10, 12, 18, 14, 20])
+    reserves = [0, 11, 14, 15, 19, 22]
+
+    # One auction per reserve, all in one call
+    bid_matrix = np.array([[b for (_, b) in bids]] * len(reserves))
+    (alloc, payments) = GSP.compute_batch(slot_clicks, reserves, bid_matrix)
+    assert alloc.shape == payments.shape == (len(reserves), 4)
+
+    for (row, reserve) in enumerate(reserves):
+        (expected_alloc, expected_payments) = GSP.compute(slot_clicks,
+                                                          reserve, bids)
+        k = len(expected_alloc)
+        assert alloc[row, :k].tolist() == expected_alloc
+        assert payments[row, :k].tolist() == expected_payments
+        assert (alloc[row, k:] == -1).all()
+        assert (payments[row, k:] == 0).all()
+
+
+def test_compute_batch_ties():
+    np = pytest.importorskip('numpy')
+    # Bidders 0 and 2 tie for the top slot; each should win half the time
+    trials = 20000
+    bids = np.tile([7, 3, 7, 1], (trials, 1))
+    rng = np.random.RandomState(0)
+    (alloc, payments) = GSP.compute_batch([5, 2], 2, bids, rng)
+    assert set(alloc[:, 0].tolist()) == set([0, 2])
+    assert abs((alloc[:, 0] == 0).mean() - 0.5) < 0.02
+    assert (payments == [7, 3]).all()
+
+
+def test_bid_ranges_all_slots():
+    random.seed(0)
+    for trial in range(200):
+        n = random.randint(0, 8)
+        bids = [(i, random.randint(0, 20)) for i in range(n)]
+        slot_clicks = [1] * random.randint(1, 10)
+        reserve = random.randint(0, 15)
+        expected = [GSP.bid_range_for_slot(s, slot_clicks, reserve, bids)
+                    for s in range(len(slot_clicks))]
+        assert GSP.bid_ranges(slot_clicks, reserve, bids) == expected
+
+
+def test_cutoff_bid():
+    random.seed(0)
+    for trial in range(200):
+        n = random.randint(1, 50)
+        if trial % 2:
+            amounts = [random.randint(0, 2 * n) for i in range(n)]
+        else:
+            # Too spread out, or not integers, to count
+            amounts = [random.choice([random.random(), 10 ** 6 * i])
+                       for i in range(n)]
+        k = random.randint(1, n)
+        assert cutoff_bid(amounts, k) == sorted(amounts, reverse=True)[k-1]
+
+
+def test_top_bids_ties():
+    random.seed(0)
+    # Bidders 0, 1 and 2 tie at the cutoff for two places
+    bids = [(0, 9), (1, 9), (2, 9)] + [(i, 1) for i in range(3, 50)]
+    trials = 6000
+    first = [0, 0, 0]
+    for trial in range(trials):
+        top = top_bids(2, bids, 2)
+        assert [b for (_, b) in top] == [9, 9]
+        first[top[0][0]] += 1
+    for count in first:
+        assert abs(count / float(trials) - 1 / 3.0) < 0.03
+
+
+def test_large_market():
+    random.seed(0)
+    n = 5000
+    slot_clicks = [50, 30, 10]
+    assert is_large_market(n, len(slot_clicks))
+    assert not is_large_market(n, n - 1)
+    # Distinct bids, so there's only one right answer
+    amounts = random.sample(range(10 * n), n)
+    bids = list(enumerate(amounts))
+    reserve = 100
+    ranked = sorted(bids, key=lambda (a, b): b, reverse=True)
+    expected = ([a for (a, _) in ranked[:3]],
+                [b for (_, b) in ranked[1:4]])
+    assert GSP.compute(slot_clicks, reserve, bids) == expected
+
+    # Integer bids with ties at the cutoff, through the counting path
+    bids = [(i, 100 + i % 3) for i in range(n)]
+    (alloc, payments) = GSP.compute(slot_clicks, 0, bids)
+    assert len(set(alloc)) == 3
+    assert all(a % 3 == 2 for a in alloc)
+    assert payments == [102, 102, 102]
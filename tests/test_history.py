@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+# http://pytest.org/
+# run py.test to run the tests (it magically finds things
+# called test_blah and runs them)
+
+import random
+
+from auction import sim
+from history import RECENT_ROUNDS, CompactHistory, History, SpendLedger, pack
+from stats import Stats
+
+
+def scan_spent(history, agent_id, end):
+    """Spend of agent_id through (not including) round end, the slow way."""
+    s = 0
+    for t in range(end):
+        r = history.round(t)
+        if agent_id in r.occupants:
+            s += r.slot_payments[list(r.occupants).index(agent_id)]
+    return s
+
+
+def test_ledger():
+    ledger = SpendLedger(3, 10)
+    ledger.record([2, 0], [6, 3])
+    assert ledger.totals == [3, 0, 6]
+    assert ledger.previous == [0, 0, 0]
+    ledger.record([2, 1], [5, 1])
+    assert ledger.totals == [3, 1, 11]
+    assert ledger.previous == [3, 0, 6]
+    assert ledger.spent(2) == 11
+    assert ledger.remaining(0) == 7
+    assert not ledger.has_money(2)
+    assert ledger.has_money(1)
+
+
+def test_sim_spend_matches_scan(make_config):
+    random.seed(7)
+    config = make_config(['Truthful', 'rwjlbb', 'rwjlbb', 'rwjlbudget_jacob'],
+                         [40, 90, 130, 160], budget=4000)
+    history = sim(config)
+    rounds = history.num_rounds()
+    assert rounds == 48
+    for a_id in range(4):
+        assert history.agents_spent[a_id] == scan_spent(history, a_id, rounds)
+
+
+def test_round_is_shared_and_read_only():
+    bids = [[(0, 10), (1, 5)]]
+    occupants = [[0, 1]]
+    clicks = [[3, 2]]
+    history = History(bids, occupants, clicks, [[5, 0]], [[15, 0]], 2)
+
+    r = history.round(0)
+    assert history.round(0) is r
+    assert r.bids == ((0, 10), (1, 5))
+    assert r.occupants.index(1) == 1
+
+    try:
+        r.clicks[0] = 100
+        assert False, "round history should be read-only"
+    except TypeError:
+        pass
+    try:
+        r.bids = []
+        assert False, "round history should be read-only"
+    except AttributeError:
+        pass
+    assert history.round(0).clicks == (3, 2)
+
+
+def test_running_stats_match_replay(make_config):
+    random.seed(11)
+    values = [40, 90, 130, 160]
+    for mechanism in ['gsp', 'vcg']:
+        config = make_config(['Truthful', 'rwjlbb', 'rwjlbb',
+                              'rwjlbudget_jacob'], values, budget=4000,
+                             mechanism=mechanism)
+        history = sim(config)
+        assert history.totals is not None
+
+        stats = Stats(history, dict(enumerate(values)))
+        replayed = Stats(history, dict(enumerate(values)), replay=True)
+        for a_id in range(4):
+            assert stats.total_utility(a_id) == replayed.total_utility(a_id)
+            assert stats.total_clicks(a_id) == replayed.total_clicks(a_id)
+            assert stats.total_spent(a_id) == replayed.total_spent(a_id)
+            assert stats.total_spent(a_id) == history.agents_spent[a_id]
+        assert stats.total_revenue() == replayed.total_revenue()
+
+        # Different values than the simulation used: fall back to replay
+        other = Stats(history, dict(enumerate([50, 90, 130, 160])))
+        assert other.running_totals(0) is None
+        assert other.total_utility(0) == Stats(
+            history, dict(enumerate([50, 90, 130, 160])),
+            replay=True).total_utility(0)
+
+
+def test_pack():
+    assert pack([1, 2, 3]).typecode == 'l'
+    assert pack([1.5, 2.0]).typecode == 'd'
+    # Mixed types, and ints too big for an array, stay as they are
+    assert pack([1, 2.5]) == (1, 2.5)
+    assert pack([2 ** 70]) == (2 ** 70,)
+    assert list(pack([])) == []
+
+
+def types(r):
+    """Types of the bids and the other numbers of a round"""
+    return ([type(b) for (_, b) in r.bids] +
+            [type(x) for field in r[1:] for x in field])
+
+
+def test_compact_history(make_config):
+    config = make_config(['Truthful', 'rwjlbb', 'rwjlbudget_cos'],
+                         [40, 95, 150], budget=3000)
+    random.seed(3)
+    compact = sim(config)
+    config.add('history_class', History)
+    random.seed(3)
+    plain = sim(config)
+
+    assert isinstance(compact, CompactHistory)
+    assert compact.num_rounds() == plain.num_rounds() == 48
+    for t in range(48):
+        r = compact.round(t)
+        assert r == plain.round(t)
+        # Numbers come back with the same types
+        assert types(r) == types(plain.round(t))
+    assert len(compact._rounds) <= RECENT_ROUNDS
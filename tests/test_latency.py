@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+
+import time
+
+import pytest
+
+from auction import sim
+from latency import BidLatency, LatencyHistogram
+
+
+class Slow:
+    """Bids 10 + t, but takes 20ms over round 3."""
+    def __init__(self, id, value, budget):
+        self.id = id
+        self.value = value
+        self.calls = 0
+
+    def initial_bid(self, reserve):
+        return 10
+
+    def bid(self, t, history, reserve):
+        self.calls += 1
+        if t == 3:
+            time.sleep(0.02)
+        return 10 + t
+
+
+def test_histogram():
+    h = LatencyHistogram()
+    assert h.percentile(0.5) is None
+    for us in range(1, 101):
+        h.add(us / 1e6)
+    assert h.count == 100
+    assert h.max == 100 / 1e6
+    # Within a bucket of the exact quantiles
+    assert 50e-6 <= h.percentile(0.5) <= 50e-6 * 1.2
+    assert 99e-6 <= h.percentile(0.99) <= 100e-6
+    assert h.percentile(1.0) == 100 / 1e6
+
+    other = LatencyHistogram()
+    other.add(1.0)
+    h.merge(other)
+    assert (h.count, h.max) == (101, 1.0)
+
+
+def test_take_and_merge():
+    latency = BidLatency(2, budget=0.01)
+    assert latency.record(0, 0.001, True) == False
+    assert latency.record(1, 0.02, False) == True
+    taken = latency.take()
+    assert latency.over_budget == [0, 0]
+
+    total = BidLatency(2, budget=0.01)
+    total.merge(taken)
+    assert total.over_budget == [0, 1]
+    assert (total.initial[0].count, total.bids[1].count) == (1, 1)
+
+
+@pytest.fixture
+def slow_config(make_config):
+    config = make_config(['Truthful', 'Truthful'], [50, 60], num_rounds=8)
+    config.agent_class_names = ['Truthful', 'Slow']
+    config.agent_classes['Slow'] = Slow
+    return config
+
+
+def test_slow_agent_flagged(slow_config):
+    config = slow_config
+    config.add('bid_latency', BidLatency(2, budget=0.01))
+    history = sim(config)
+    assert config.bid_latency.over_budget == [0, 1]
+    assert config.bid_latency.bids[1].count == 7
+    # Without reuse, bids are unchanged
+    assert [dict(history.round(t).bids)[1] for t in range(8)] == [
+        10, 11, 12, 13, 14, 15, 16, 17]
+
+
+def test_slow_agent_benched(slow_config):
+    config = slow_config
+    config.add('bid_latency', BidLatency(2, budget=0.01, reuse=True))
+    history = sim(config)
+    assert config.bid_latency.benched == [0, 1]
+    # The slow bid and all later ones are replaced by the last one in time
+    assert [dict(history.round(t).bids)[1] for t in range(8)] == [
+        10, 11, 12, 12, 12, 12, 12, 12]
+    assert config.bid_latency.bids[1].count == 3
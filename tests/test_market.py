@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+
+# http://pytest.org/
+# run py.test to run the tests (it magically finds things
+# called test_blah and runs them)
+
+import random
+
+from history import History
+from gsp import GSP
+from market import MarketContext
+from rwjlbb import rwjlbb as BBAgent
+
+
+def test_leave_one_out_ranges():
+    random.seed(0)
+    for trial in range(200):
+        n = random.randint(1, 8)
+        bids = [(i, random.randint(0, 20)) for i in range(n)]
+        clicks = [random.randint(0, 50) for s in range(random.randint(1, 8))]
+        reserve = random.randint(0, 15)
+        market = MarketContext(bids, clicks, reserve)
+
+        assert list(market.sorted_bids) == GSP.sorted_bids(reserve, bids)
+        for (a_id, _) in bids:
+            others = [(i, b) for (i, b) in bids if i != a_id]
+            assert (market.bid_ranges(a_id) ==
+                    GSP.bid_ranges(clicks, reserve, others))
+
+
+def test_bb_with_market():
+    # Same setting as test_bb.test_bb_reserve
+    t = 1
+    reserve = 5
+    bids = [[(3, 10), (2, 7), (1, 6)]]
+    slot_clicks = [[3, 2, 1]]
+    history = History(bids, [[3, 2, 1]], slot_clicks, [[7, 6, 5]],
+                      [[21, 12, 5]])
+    market = MarketContext(bids[0], slot_clicks[0], reserve)
+
+    for (a_id, value) in [(1, 8), (2, 10), (3, 20)]:
+        a = BBAgent(a_id, value, 1000)
+        assert (a.slot_info(t, history, reserve, market) ==
+                a.slot_info(t, history, reserve))
+        assert (a.bid(t, history, reserve, market) ==
+                a.bid(t, history, reserve))
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+
+from auction import run_perm
+from profiling import Profiler
+
+
+def test_laps_and_merge():
+    p = Profiler()
+    p.mark()
+    p.lap('a')
+    p.lap('a')
+    p.add('b', 2.0, 3)
+    assert p.calls == {'a': 2, 'b': 3}
+
+    times = p.take()
+    assert p.seconds == {}
+    other = Profiler()
+    other.add('b', 1.0)
+    other.merge(times)
+    assert other.calls == {'a': 2, 'b': 4}
+    assert other.seconds['b'] == 3.0
+
+    rows = dict((r['phase'], r) for r in other.summary(6.0))
+    assert rows['b']['per_call'] == 0.75
+    assert rows['b']['fraction'] == 0.5
+
+
+def test_profiled_run_perm(make_config):
+    config = make_config(['Truthful', 'rwjlbb', 'rwjlbb'], [0, 0, 0])
+    expected = run_perm(config, [30, 110, 70], 99)
+
+    config.add('profiler', Profiler())
+    assert run_perm(config, [30, 110, 70], 99) == expected
+    calls = config.profiler.calls
+    assert calls['sim/bid Truthful'] == 48
+    assert calls['sim/bid rwjlbb'] == 2 * 48
+    for phase in ['clicks', 'mechanism', 'payments', 'spend', 'utility',
+                  'market context', 'history']:
+        assert calls['sim/' + phase] == 48
+    assert calls['run_perm/stats'] == 1
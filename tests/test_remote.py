@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+import socket
+import threading
+import time
+from timeit import default_timer as timer
+
+import pytest
+
+import remote
+from auction import run_perm
+from remote import make_server
+from rwjlbb import rwjlbb
+from truthful import Truthful
+
+
+class SlowTruthful(Truthful):
+    """Truthful, but takes DELAY seconds to bid.  Records when each call
+    started and ended in calls."""
+    DELAY = 0.05
+    calls = []
+
+    __slots__ = ()
+
+    def initial_bid(self, reserve):
+        return self.slow_bid(0)
+
+    def bid(self, t, history, reserve):
+        return self.slow_bid(t)
+
+    def slow_bid(self, t):
+        start = timer()
+        time.sleep(self.DELAY)
+        SlowTruthful.calls.append((t, start, timer()))
+        return self.value
+
+
+class FailingTruthful(Truthful):
+    """Truthful, but its bid() fails after round 1."""
+    __slots__ = ()
+
+    def bid(self, t, history, reserve):
+        if t > 1:
+            raise ValueError("no bid")
+        return self.value
+
+
+def serve(agent_class, address="127.0.0.1:0"):
+    """Start a stand-in server in the background.  Returns the agent
+    class name to simulate with."""
+    server = make_server(agent_class, address)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return "remote@%s" % server.address
+
+
+def test_remote_matches_local(tmpdir, make_config):
+    names = [serve(Truthful, str(tmpdir.join('truthful.sock')))] * 2
+    names += [serve(rwjlbb)] * 2
+    remote = make_config(names, [0] * 4)
+    local = make_config(['Truthful'] * 2 + ['rwjlbb'] * 2, [0] * 4)
+    for (seed, vals) in enumerate([[40, 95, 150, 120], [150, 40, 95, 60]]):
+        assert run_perm(remote, vals, seed) == run_perm(local, vals, seed)
+
+
+def test_bids_are_gathered_concurrently(make_config):
+    names = [serve(SlowTruthful)] * 3
+    config = make_config(names, [0] * 3, num_rounds=4)
+    del SlowTruthful.calls[:]
+    (_, _, revenue) = run_perm(config, [40, 95, 150], 0)
+    local = make_config(['Truthful'] * 3, [0] * 3, num_rounds=4)
+    assert revenue == run_perm(local, [40, 95, 150], 0)[2]
+    # Every agent's call for a round starts before any of them ends
+    for t in range(4):
+        calls = [(start, end) for (u, start, end) in SlowTruthful.calls
+                 if u == t]
+        assert len(calls) == 3
+        assert max(start for (start, _) in calls) < min(end for (_, end)
+                                                        in calls)
+
+
+def test_errors_keep_previous_bid(make_config):
+    names = [serve(FailingTruthful)] + [serve(Truthful)] * 2
+    config = make_config(names, [0] * 3, num_rounds=6)
+    local = make_config(['Truthful'] * 3, [0] * 3, num_rounds=6)
+    # FailingTruthful's last bid before failing is its value, so nothing
+    # changes
+    assert (run_perm(config, [40, 95, 150], 0) ==
+            run_perm(local, [40, 95, 150], 0))
+
+
+def test_close_connections(make_config):
+    config = make_config([serve(Truthful)] * 2, [0] * 2, num_rounds=2)
+    run_perm(config, [40, 95], 0)
+    conns = remote._connections.values()
+    assert conns
+    remote.close_connections()
+    assert remote._connections == {}
+    for conn in conns:
+        with pytest.raises(socket.error):
+            conn.sock.getpeername()
+
+
+def test_late_bids_are_dropped(make_config):
+    names = [serve(SlowTruthful)] * 3
+    config = make_config(names, [0] * 3, num_rounds=3)
+    config.add('remote_deadline', 1000 * SlowTruthful.DELAY / 5)
+    # Nobody bids in time, so every bid stays 0 and the slots are free
+    (_, spent, revenue) = run_perm(config, [40, 95, 150], 0)
+    assert spent == [0, 0, 0]
+    assert revenue == 0
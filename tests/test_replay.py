@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from auction import run_perm
+from replay import replay
+from traces import Trace, TraceWriter
+
+
+def traced_runs(make_config, tmpdir, mechanism, perms):
+    """Run perms of three Truthful agents, tracing them.  Returns the trace
+    and run_perm's results."""
+    config = make_config(['Truthful'] * 3, [0, 0, 0], mechanism=mechanism,
+                         num_rounds=12)
+    writer = TraceWriter(str(tmpdir.join(mechanism)), config.agent_class_names,
+                         2, 30)
+    config.add('trace', writer)
+    results = [run_perm(config, vals, seed)
+               for (seed, vals) in enumerate(perms)]
+    writer.close()
+    return (Trace(str(tmpdir.join(mechanism))), results)
+
+
+@pytest.mark.parametrize('mechanism', ['gsp', 'vcg'])
+def test_replay_matches_simulation(make_config, tmpdir, mechanism):
+    # Distinct values, so no ties and only one outcome
+    perms = [[40, 95, 150], [95, 150, 40], [150, 40, 95], [30, 60, 90]]
+    (trace, results) = traced_runs(make_config, tmpdir, mechanism, perms)
+    [r] = replay(trace, [mechanism], [0])
+
+    revenues = [rev for (_, _, rev) in results]
+    assert r['revenue']['n'] == 4
+    assert r['revenue']['mean'] == pytest.approx(np.mean(revenues))
+    utilities = np.mean([utils for (utils, _, _) in results], axis=0)
+    assert r['utility']['mean'] == pytest.approx(utilities.tolist())
+    spends = np.mean([spent for (_, spent, _) in results], axis=0)
+    assert r['spend']['mean'] == pytest.approx(spends.tolist())
+
+
+def test_reserve_grid(make_config, tmpdir):
+    (trace, results) = traced_runs(make_config, tmpdir, 'gsp', [[40, 95, 150]])
+    by_reserve = dict((r['reserve'], r) for r in
+                      replay(trace, ['gsp', 'vcg'], [0, 100, 200])
+                      if r['mechanism'] == 'gsp')
+    # Truthful bids: 150 wins the top slot, and with a reserve of 100 the
+    # second slot goes unsold and the top one pays 100 a click
+    clicks = [sum(trace.simulation(0)['clicks'][:, s]) for s in range(2)]
+    assert by_reserve[0]['revenue']['mean'] == 95 * clicks[0] + 40 * clicks[1]
+    assert by_reserve[100]['revenue']['mean'] == 100 * clicks[0]
+    assert by_reserve[200]['revenue']['mean'] == 0
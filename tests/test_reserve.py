@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+
+import random
+
+import pytest
+
+from auction import configure, make_parser, run_perm
+import reserve
+from reserve import ReserveSearch, draw_tasks, parse_reserves
+
+
+def make_search(args, reserves, seed=0):
+    (options, args) = make_parser().parse_args(args)
+    agents = configure(options, args)
+    random.seed(seed)
+    search = ReserveSearch(options, draw_tasks(len(agents), options))
+    search.evaluate(reserves)
+    return search
+
+
+def test_parse_reserves():
+    assert parse_reserves("10,0,10", 175) == [0, 10]
+    assert parse_reserves("0:100:25", 175) == [0, 25, 50, 75, 100]
+    assert parse_reserves(None, 160) == [0, 20, 40, 60, 80, 100, 120, 140, 160]
+
+
+def test_common_random_numbers():
+    search = make_search(['--iters', '3', '--num-rounds', '12',
+                          'Truthful,3'], [0, 60])
+    assert len(search.draws) == 3
+    # Every reserve is simulated on the same draws
+    options = search.options
+    for r in [0, 60]:
+        expected = []
+        for perms in search.draws:
+            options.reserve = r
+            revs = [run_perm(options, vals, seed)[2] for (vals, seed) in perms]
+            expected.append(sum(revs) / float(len(revs)))
+        assert search.revenues[r] == expected
+
+
+def test_evaluate_leaves_options_alone():
+    search = make_search(['--iters', '2', '--num-rounds', '12',
+                          '--reserve', '10', 'Truthful,3'], [0, 60])
+    assert search.options.reserve == 10
+
+
+def test_refine_brackets_best():
+    search = make_search(['--iters', '4', '--num-rounds', '12',
+                          'Truthful,3'], [0, 80, 160])
+    coarse = search.best()
+    search.refine(10, min_step=5)
+    best = search.best()
+    assert search.mean(best) >= search.mean(coarse)
+    points = sorted(search.revenues)
+    k = points.index(best)
+    # Refining stopped because the best reserve's neighbours are close
+    for neighbour in points[max(0, k - 1):k + 2]:
+        assert abs(neighbour - best) < 10
+
+    curve = search.curve()
+    assert [row['reserve'] for row in curve] == points
+    [row] = [row for row in curve if row['best']]
+    assert row['reserve'] == best
+    assert row['vs_best']['mean'] == 0
+
+
+@pytest.mark.parametrize('flag', [['--dedup'], ['--lockstep'],
+                                  ['--tolerance', '5'], ['--jsonl', 'x']])
+def test_rejects_sweep_options(flag, capsys):
+    with pytest.raises(SystemExit):
+        reserve.main(['reserve.py'] + flag + ['Truthful,3'])
+    assert "isn't supported" in capsys.readouterr()[0]
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+
+# http://pytest.org/
+# run py.test to run the tests (it magically finds things
+# called test_blah and runs them)
+
+import itertools
+import math
+
+from symmetry import (class_groups, distinct_assignments, group_average,
+                      num_assignments)
+
+
+def canonical(vals, groups):
+    return tuple(tuple(sorted(vals[a_id] for a_id in g)) for g in groups)
+
+
+def check_weights(values, class_names):
+    groups = class_groups(class_names)
+    expected = {}
+    for vals in itertools.permutations(values):
+        key = canonical(vals, groups)
+        expected[key] = expected.get(key, 0) + 1
+
+    assignments = distinct_assignments(values, groups)
+    assert len(assignments) == len(expected)
+    assert len(assignments) <= num_assignments(groups)
+    assert sum(w for (_, w) in assignments) == math.factorial(len(values))
+    for (vals, weight) in assignments:
+        assert expected[canonical(vals, groups)] == weight
+
+
+def test_class_groups():
+    assert (class_groups(['Truthful', 'rwjlbb', 'Truthful', 'BBAgent']) ==
+            [[0, 2], [1], [3]])
+
+
+def test_distinct_assignments():
+    classes = ['Truthful'] * 5 + ['rwjlbb'] * 2
+    check_weights([30, 40, 50, 60, 70, 80, 90], classes)
+    assert num_assignments(class_groups(classes)) == 21
+    # Repeated values collapse more permutations together
+    check_weights([30, 30, 50, 60, 60, 80, 90], classes)
+    check_weights([10, 20, 30, 40], ['A', 'B', 'A', 'C'])
+    check_weights([10, 20, 30], ['A', 'B', 'C'])
+
+
+def test_group_average():
+    groups = [[0, 2], [1]]
+    assert group_average([4, 7, 8], groups) == [6.0, 7, 6.0]
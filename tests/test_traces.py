@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+
+import random
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from auction import run_perm, sim
+from cache import SimCache
+from traces import Trace, TraceWriter
+
+
+def test_write_and_read(tmpdir, make_config):
+    config = make_config(['Truthful', 'rwjlbb', 'rwjlbudget_cos'],
+                         [0, 0, 0], num_rounds=10)
+    # Shards of 25 rounds hold two simulations each
+    writer = TraceWriter(str(tmpdir), config.agent_class_names, 2, 25)
+    config.add('trace', writer)
+    perms = [[40, 95, 150], [95, 150, 40], [150, 40, 95]]
+    for (seed, vals) in enumerate(perms):
+        run_perm(config, vals, seed)
+    writer.close()
+
+    trace = Trace(str(tmpdir))
+    assert trace.agents == ['Truthful', 'rwjlbb', 'rwjlbudget_cos']
+    assert [e['values'] for e in trace.simulations] == perms
+    assert [e['seed'] for e in trace.simulations] == [0, 1, 2]
+    assert len(trace.shards()) == 2
+    assert trace.num_rounds() == 30
+
+    # Same rounds as the simulation
+    config.trace = None
+    config.agent_values = perms[2]
+    random.seed(2)
+    history = sim(config)
+    s = trace.simulation(2)
+    assert isinstance(s['bids'], np.memmap)
+    for t in range(10):
+        r = history.round(t)
+        assert s['bids'][t].tolist() == [b for (_, b) in r.bids]
+        k = len(r.occupants)
+        assert s['occupants'][t, :k].tolist() == list(r.occupants)
+        assert (s['occupants'][t, k:] == -1).all()
+        assert s['clicks'][t].tolist() == list(r.clicks)
+        assert s['slot_payments'][t, :k].tolist() == list(r.slot_payments)
+
+
+def test_cached_simulations_are_traced(tmpdir, make_config):
+    config = make_config(['Truthful', 'rwjlbb'], [0, 0], num_rounds=5)
+    config.add('cache', SimCache(str(tmpdir.join('cache')), 1024 * 1024))
+    writer = TraceWriter(str(tmpdir.join('trace')), config.agent_class_names,
+                         1)
+    config.add('trace', writer)
+    run_perm(config, [40, 95], 7)
+    run_perm(config, [40, 95], 7)
+    writer.close()
+
+    trace = Trace(str(tmpdir.join('trace')))
+    assert len(trace.simulations) == 2
+    a = trace.simulation(0)
+    b = trace.simulation(1)
+    for name in a:
+        assert (a[name] == b[name]).all()
@@ -4,6 +4,10 @@
 # run py.test to run the tests (it magically finds things
 # called test_blah and runs them)
 
+import random
+
+import pytest
+
 from vcg import VCG
 
 # vcg payment: util to others without you - util to others with you
@@ -86,3 +90,82 @@ def test_bid_ranges():
     assert bid_range(0, reserve) == (22, None)
     assert bid_range(1, reserve) == (22, 22)
     assert bid_range(2, reserve) == (22, 22)
+
+
+def test_compute_batch():
+    np = pytest.importorskip('numpy')
+    slot_clicks = [4,3,2,1]
+    bids = zip(range(5), [10, 12, 18, 14, 20])
+    reserves = [0, 11, 14, 15, 19, 22]
+
+    # The cases from test_mechanism, one auction per reserve
+    bid_matrix = np.array([[b for (_, b) in bids]] * len(reserves))
+    (alloc, payments) = VCG.compute_batch(slot_clicks, reserves, bid_matrix)
+    assert alloc.shape == payments.shape == (len(reserves), 4)
+
+    for (row, reserve) in enumerate(reserves):
+        (expected_alloc, expected_payments) = VCG.compute(slot_clicks,
+                                                          reserve, bids)
+        k = len(expected_alloc)
+        assert alloc[row, :k].tolist() == expected_alloc
+        assert payments[row, :k].tolist() == expected_payments
+        assert (alloc[row, k:] == -1).all()
+        assert (payments[row, k:] == 0).all()
+
+    # Fractional bids use true division, like the scalar version
+    float_bids = bid_matrix[:1] + 0.5
+    (alloc, payments) = VCG.compute_batch(slot_clicks, 0, float_bids)
+    (expected_alloc, expected_payments) = VCG.compute(
+        slot_clicks, 0, zip(range(5), float_bids[0].tolist()))
+    assert alloc[0].tolist() == expected_alloc
+    assert payments[0].tolist() == pytest.approx(expected_payments)
+
+
+def test_many_slots():
+    np = pytest.importorskip('numpy')
+    # Deep enough that a recursive payment computation would blow the stack
+    num_slots = 3000
+    slot_clicks = [num_slots - i for i in range(num_slots)]
+    bid_values = range(1, num_slots + 2)
+    bids = zip(range(num_slots + 1), bid_values)
+
+    (alloc, payments) = VCG.compute(slot_clicks, 0, bids)
+    assert alloc == range(num_slots, 0, -1)
+    # Every slot has one click more than the slot below it, so each bidder
+    # pays one click at each lower bid, plus the losing bid for the bottom
+    # slot's click
+    assert payments[-1] == 1
+    assert payments[0] == sum(range(1, num_slots + 1)) / num_slots
+
+    (batch_alloc, batch_payments) = VCG.compute_batch(
+        slot_clicks, 0, np.array([bid_values]))
+    assert batch_alloc[0].tolist() == alloc
+    assert batch_payments[0].tolist() == payments
+
+
+def test_zero_click_slots():
+    slot_clicks = [2, 1, 0, 0]
+    bids = zip(range(5), [10, 12, 18, 14, 20])
+    (alloc, payments) = VCG.compute(slot_clicks, 0, bids)
+    assert alloc == [4, 2, 3, 1]
+    # (2-1)*18 + 1*14 = 32 and 1*14 = 14; the other slots get no clicks
+    assert payments == [16, 14, 0, 0]
+
+
+def test_bid_ranges_all_slots():
+    slot_clicks = [4,3,2,1]
+    bids = zip(range(1,6), [10, 12, 18, 14, 20])
+    assert VCG.bid_ranges(slot_clicks, 15, bids) == [
+        (20, None), (18, 20), (15, 18), (15, 18)]
+
+
+def test_large_market():
+    random.seed(0)
+    n = 5000
+    slot_clicks = [50, 30, 10]
+    amounts = random.sample(range(10 * n), n)
+    bids = list(enumerate(amounts))
+    # Same as VCG over the top four bidders alone
+    ranked = sorted(bids, key=lambda (a, b): b, reverse=True)
+    assert (VCG.compute(slot_clicks, 100, bids) ==
+            VCG.compute(slot_clicks, 100, ranked[:4]))